@@ -1,19 +1,288 @@
 import piece
 import numpy as np
-from eval_fn import evaluation_state
+from eval_fn import evaluation_state, evaluate_children, IncrementalEvaluator
+from transposition import EXACT, LOWER, UPPER
+from threats import WIN_SCORE, find_forced_win, forced_blocks, is_tactical
+from zobrist import eval_keys, zobrist_table
 import time
 
-def get_best_move(state, depth, is_max_state, difficulty="Medium"):
+# Window bounds for the negamax core; far outside any evaluation score, so
+# they never clip a real value the way minimax's +-9999 starting values do.
+INFINITY = 10 ** 9
+ASPIRATION_WINDOW = 100
+# Late-move reductions: at depth LMR_MIN_DEPTH or more, quiet moves after
+# the first LMR_FULL_MOVES are searched LMR_REDUCTION plies shallower and
+# re-searched at full depth only if they beat alpha.
+LMR_FULL_MOVES = 3
+LMR_MIN_DEPTH = 3
+LMR_REDUCTION = 1
+# Root moves searched when no candidate widths are given.
+ROOT_WIDTH = 10
+# The get_best_move keyword arguments a search options dict carries (see
+# GameRunner.search_options()).
+SEARCH_OPTIONS = ('threat_budget', 'algorithm', 'timers', 'lmr', 'widths', 'frontier')
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchContext:
+    # Per-call search state shared by every node of one get_best_move.
+    # stop is anything with is_set() (e.g. a threading.Event); once set,
+    # the search is abandoned like a missed deadline. progress, if given, has
+    # report(depth, nodes) called with the iteration's depth every 64 nodes
+    # and at the start of each iteration. lmr turns on late-move reductions;
+    # widths limits the moves searched at each ply from the root (the last
+    # entry applies to deeper plies, None means all), keeping the
+    # statically best ones plus the hash move, killers and tactical moves.
+    # With frontier, a node at depth 1 scores all its children in one
+    # batch instead of visiting them one by one. eval_cache (an EvalCache)
+    # keeps leaf values across nodes and searches; it is ignored for Easy.
+    # With timers, the time spent in legal_moves, is_terminal and leaf
+    # evaluation is accumulated (it costs two clock reads per call, so it is
+    # off by default).
+    def __init__(self, difficulty="Medium", tt=None, deadline=None,
+                 algorithm="pvs", max_color=piece.BLACK, stop=None, timers=False,
+                 progress=None, lmr=False, widths=None, frontier=False, eval_cache=None):
+        self.difficulty = difficulty
+        self.tt = tt
+        self.deadline = deadline
+        self.stop = stop
+        self.progress = progress
+        self.depth = 0
+        self.algorithm = algorithm
+        self.max_color = max_color
+        self.lmr = lmr
+        self.widths = tuple(widths) if widths else None
+        self.frontier = frontier
+        self.eval_cache = eval_cache if difficulty != "Easy" else None
+        self.eval_keys = eval_keys(difficulty)
+        self.nodes = 0
+        self.leaves = 0
+        self.interior = 0
+        self.children = 0
+        self.cutoffs = 0
+        self.cutoffs_by_ply = {}
+        self.reductions = 0
+        self.researches = 0
+        # Table and leaf-cache counts of pool workers' own tables (see merge).
+        self.worker_counts = {}
+        self.killers = {}
+        self.history = {}
+        self.times = None
+        if timers:
+            self.times = {'legal_moves': 0.0, 'is_terminal': 0.0, 'evaluation': 0.0}
+
+    def visit(self):
+        self.nodes += 1
+        if self.nodes & 63 == 0:
+            if self.deadline is not None and time.time() > self.deadline:
+                raise SearchTimeout()
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout()
+            if self.progress is not None:
+                self.progress.report(self.depth, self.nodes)
+
+    def start_iteration(self, depth):
+        self.depth = depth
+        if self.progress is not None:
+            self.progress.report(depth, self.nodes)
+
+    def is_terminal(self, board):
+        if self.times is None:
+            return board.is_terminal()
+        start = time.perf_counter()
+        result = board.is_terminal()
+        self.times['is_terminal'] += time.perf_counter() - start
+        return result
+
+    def evaluate(self, board):
+        # Static value of a leaf, from black's point of view.
+        self.leaves += 1
+        cache = self.eval_cache
+        if cache is not None:
+            key = board.hash ^ self.eval_keys[-board.color]
+            result = cache.get(key)
+            if result is not None:
+                return result
+        if self.times is None:
+            result = evaluate(board, -board.color, self.difficulty)
+        else:
+            start = time.perf_counter()
+            result = evaluate(board, -board.color, self.difficulty)
+            self.times['evaluation'] += time.perf_counter() - start
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    def evaluate_frontier(self, board):
+        # (moves, static values from black's point of view) for every child
+        # of board, counted as visited leaves.
+        moves = self.legal_moves(board)
+        self.interior += 1
+        self.children += len(moves)
+        self.leaves += len(moves)
+        for _ in moves:
+            self.visit()
+        start = self.times is not None and time.perf_counter()
+        if board.evaluator is not None:
+            values = board.evaluator.score_moves(moves, -board.color, board.color, self.difficulty)
+        else:
+            values = evaluate_children(board, moves, self.difficulty)
+        if self.times is not None:
+            self.times['evaluation'] += time.perf_counter() - start
+        if self.eval_cache is not None:
+            cache_children(self.eval_cache, board, moves, values, self.difficulty)
+        return moves, values
+
+    def legal_moves(self, board):
+        if self.times is None:
+            return board.legal_moves()
+        start = time.perf_counter()
+        result = board.legal_moves()
+        self.times['legal_moves'] += time.perf_counter() - start
+        return result
+
+    def stats(self):
+        stats = {
+            'nodes': self.nodes,
+            'leaves': self.leaves,
+            'interior': self.interior,
+            'children': self.children,
+            'branching': self.children / self.interior if self.interior else 0.0,
+            'cutoffs': self.cutoffs,
+            'cutoffs_by_ply': dict(sorted(self.cutoffs_by_ply.items())),
+            'reductions': self.reductions,
+            'researches': self.researches,
+        }
+        if self.times is not None:
+            stats['time'] = dict(self.times)
+        return stats
+
+    def merge(self, stats):
+        # Adds the stats() of a search run elsewhere (a pool worker's share
+        # of the root moves) to this one's.
+        self.nodes += stats['nodes']
+        self.leaves += stats['leaves']
+        self.interior += stats['interior']
+        self.children += stats['children']
+        self.cutoffs += stats['cutoffs']
+        for ply, count in stats['cutoffs_by_ply'].items():
+            self.cutoffs_by_ply[ply] = self.cutoffs_by_ply.get(ply, 0) + count
+        self.reductions += stats['reductions']
+        self.researches += stats['researches']
+        for key in ('tt_probes', 'tt_hits', 'eval_hits', 'eval_misses'):
+            if key in stats:
+                self.worker_counts[key] = self.worker_counts.get(key, 0) + stats[key]
+        if self.times is not None and 'time' in stats:
+            for key, seconds in stats['time'].items():
+                self.times[key] += seconds
+
+    def sign(self, board):
+        # +1 when the side to move is the maximizing color.
+        return 1 if -board.color == self.max_color else -1
+
+    def width(self, ply):
+        if self.widths is None:
+            return None
+        return self.widths[min(ply, len(self.widths) - 1)]
+
+    def cells(self, board):
+        if board.evaluator is not None:
+            return board.evaluator.cells
+        return board.values.ravel().tolist()
+
+    def tactical(self, board, move):
+        # is_tactical, from the bitboards when the board keeps them.
+        k = move[0] * board.size + move[1]
+        if board.bits is not None:
+            return board.bits.tactical(k)
+        return is_tactical(self.cells(board), board.size, k)
+
+    def narrow(self, board, moves, width, keep):
+        # The width statically best moves plus any of keep and any tactical
+        # move (a four or open three of either color), in static order.
+        is_max_state = self.sign(board) == 1
+        ranked = [move for move, _ in get_top_moves(board, len(moves), is_max_state,
+                                                     self.difficulty, moves, self.eval_cache)]
+        return ranked[:width] + [move for move in ranked[width:]
+                                 if move in keep or self.tactical(board, move)]
+
+    def order_moves(self, board, hash_move=None, depth=None):
+        # Hash move first, then this ply's killer moves, then the rest by
+        # history score; ties keep legal_moves' row-major order (static
+        # order when the ply has a width). Nodes whose children are leaves
+        # are not narrowed: evaluating every leaf costs less than ranking.
+        self.interior += 1
+        killers = self.killers.get(len(board.history), ())
+        history = self.history
+        moves = self.legal_moves(board)
+        width = self.width(len(board.history))
+        if width is not None and len(moves) > width and depth is not None and depth > 1:
+            moves = self.narrow(board, moves, width, killers + (hash_move,))
+
+        def key(move):
+            if move == hash_move:
+                return (0, 0)
+            if move in killers:
+                return (1, killers.index(move))
+            return (2, -history.get(move, 0))
+
+        return sorted(moves, key=key)
+
+    def reduction(self, board, move, index, depth):
+        # Plies to take off move, the index-th searched at a node of this
+        # depth; called before move is pushed.
+        if (not self.lmr or depth < LMR_MIN_DEPTH or index < LMR_FULL_MOVES
+                or move in self.killers.get(len(board.history), ())):
+            return 0
+        if self.tactical(board, move):
+            return 0
+        self.reductions += 1
+        return LMR_REDUCTION
+
+    def cutoff(self, board, move, depth):
+        self.cutoffs += 1
+        ply = len(board.history)
+        self.cutoffs_by_ply[ply] = self.cutoffs_by_ply.get(ply, 0) + 1
+        killers = self.killers.get(ply, ())
+        if move not in killers:
+            self.killers[ply] = (move,) + killers[:1]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+
+
+def search_kwargs(options):
+    # get_best_move keyword arguments for a search run from an options dict;
+    # the table, book, evaluation cache and stop flag are the caller's.
+    return {key: options[key] for key in SEARCH_OPTIONS}
+
+
+def get_best_move(state, depth, is_max_state, difficulty="Medium", tt=None,
+                  time_budget=None, info=None, pool=None, threat_budget=None,
+                  algorithm="pvs", book=None, opening=True, stop=None, timers=False,
+                  progress=None, lmr=False, widths=None, frontier=False, eval_cache=None):
     start_time = time.time()
     values = state.values
-    best_value = is_max_state and -9999 or 9999
-    best_move = (-1, -1)
     pieces = np.count_nonzero(values != piece.EMPTY)
+    if info is None:
+        info = {}
+    info['depth'] = 0
+    info['nodes'] = 0
+    info['cutoffs'] = 0
+
+    if book is not None and difficulty != "Easy":
+        hit = book.lookup(state)
+        if hit is not None:
+            info['book'] = True
+            move, value = hit
+            return move, value, time.time() - start_time
 
+    # opening=False searches the reply to the first stone instead of using
+    # second_move (the book builder wants a real reply there).
     if pieces == 0:
         move, value, _ = first_move(state) 
         return move, value, time.time() - start_time 
-    if pieces == 1:
+    if pieces == 1 and opening:
         move, value, _ = second_move(state) 
         return move, value, time.time() - start_time
                 
@@ -27,65 +296,384 @@ def get_best_move(state, depth, is_max_state, difficulty="Medium"):
             selected_move = tuple(map(int, selected_move))
         return selected_move, 0, time.time() - start_time
 
-    top_moves = get_top_moves(state, min(10, len(legal_moves)), is_max_state, difficulty)    
+    # Threat-space search first: a forced win is played at once, and a
+    # five the opponent threatens narrows the root to the block.
+    blocks = None
+    threat_time = 0.0
+    if threat_budget:
+        line = find_forced_win(state, -state.color, threat_budget)
+        if line is not None:
+            info['forced'] = line
+            value = is_max_state and WIN_SCORE or -WIN_SCORE
+            return line[0], value, time.time() - start_time
+        blocks = forced_blocks(state, -state.color) or None
+        threat_time = time.time() - start_time
 
-    for move_n_value in top_moves:
-        move = move_n_value[0]
-        value = minimax(state.next(move),
-                      -10e5,
-                      10e5,
-                      depth - 1,
-                      not is_max_state,
-                      difficulty)
+    if tt is not None:
+        tt.new_search()
+        probes, hits = tt.probes, tt.hits
+    deadline = None if time_budget is None else start_time + time_budget
+    max_color = -state.color if is_max_state else state.color
+    if eval_cache is not None:
+        eval_hits, eval_misses = eval_cache.hits, eval_cache.misses
+    ctx = SearchContext(difficulty, tt, deadline, algorithm, max_color, stop, timers, progress,
+                        lmr, widths, frontier, eval_cache)
+    board = state.search_board(IncrementalEvaluator(state))
+    width = ctx.width(0) or ROOT_WIDTH
+    top_moves = get_top_moves(board, min(width, len(legal_moves)), is_max_state, difficulty, blocks,
+                              ctx.eval_cache)
+    best_move, best_value = top_moves[0][0], top_moves[0][1]
+    search = search_root if pool is None else pool.search_root
 
-        if ((is_max_state and value > best_value)
-                or (not is_max_state and value < best_value)):
-            best_value = value
-            best_move = move
-    if best_move[0] == -1 and best_move[1] == -1 and len(top_moves) > 0:
-        best_move = top_moves[0][0]
+    if time_budget is None:
+        # Only a stop can cut a fixed-depth search short; the statically
+        # best root move then stands, with depth 0.
+        try:
+            ctx.start_iteration(depth)
+            best_move, best_value, _ = search(board, top_moves, depth, is_max_state, ctx)
+            info['depth'] = depth
+        except SearchTimeout:
+            pass
+    else:
+        # Iterative deepening: each completed iteration reorders the root
+        # moves for the next one, and the deadline aborts the current one.
+        # With PVS, each iteration after the first starts from an
+        # aspiration window around the previous iteration's score.
+        max_depth = min(depth, empty_count(state))
+        try:
+            for d in range(1, max_depth + 1):
+                ctx.start_iteration(d)
+                if d == 1 or algorithm == "minimax":
+                    result = search(board, top_moves, d, is_max_state, ctx)
+                else:
+                    result = aspiration_search(search, board, top_moves, d, is_max_state, ctx, best_value)
+                best_move, best_value, top_moves = result
+                info['depth'] = d
+        except SearchTimeout:
+            pass
+
+    info['nodes'] = ctx.nodes
+    info['cutoffs'] = ctx.cutoffs
+    stats = info['stats'] = ctx.stats()
+    if tt is not None:
+        stats['tt_probes'] = tt.probes - probes + ctx.worker_counts.get('tt_probes', 0)
+        stats['tt_hits'] = tt.hits - hits + ctx.worker_counts.get('tt_hits', 0)
+    if eval_cache is not None:
+        stats['eval_hits'] = eval_cache.hits - eval_hits + ctx.worker_counts.get('eval_hits', 0)
+        stats['eval_misses'] = (eval_cache.misses - eval_misses
+                                + ctx.worker_counts.get('eval_misses', 0))
+    if timers:
+        stats['time']['threats'] = threat_time
     if not isinstance(best_move, tuple):
         best_move = tuple(map(int, best_move))
     
     return best_move, best_value, time.time() - start_time
 
-def get_top_moves(state, n, is_max_state, difficulty="Medium"):
-    color = state.color
-    top_moves = []
+def search_root(board, top_moves, depth, is_max_state, ctx, alpha=-INFINITY, beta=INFINITY):
+    if ctx.algorithm == "minimax":
+        scored = []
+
+        for move_n_value in top_moves:
+            move = move_n_value[0]
+            board.push(move)
+            value = minimax(board,
+                          -10e5,
+                          10e5,
+                          depth - 1,
+                          not is_max_state,
+                          ctx)
+            board.pop()
+            scored.append((move, value))
 
-    for move in state.legal_moves():
-        evaluation = evaluation_state(state.next(move), color, difficulty)
-        top_moves.append((move, evaluation))
+        return best_of(scored, is_max_state)
+
+    # PVS at the root, in the root mover's negamax frame: the first move
+    # gets the full window, later ones a null window that is widened only
+    # when they beat the best so far.
+    sign = 1 if is_max_state else -1
+    low, high = (alpha, beta) if is_max_state else (-beta, -alpha)
+    best_move = top_moves[0][0]
+    best = -INFINITY
+    scored = []
+
+    for index, (move, _) in enumerate(top_moves):
+        board.push(move)
+        if index == 0:
+            score = -pvs(board, -high, -low, depth - 1, ctx)
+        else:
+            score = -pvs(board, -low - 1, -low, depth - 1, ctx)
+            if low < score < high:
+                score = -pvs(board, -high, -score, depth - 1, ctx)
+        board.pop()
+        scored.append((move, sign * score))
+
+        if score > best:
+            best = score
+            best_move = move
+        low = max(low, score)
+        if low >= high:
+            break
+
+    scored += [(move, sign * -INFINITY) for move, _ in top_moves[len(scored):]]
+    ordered = sorted(scored, key=lambda x: x[1], reverse=is_max_state)
+    ordered.sort(key=lambda x: x[0] != best_move)
+    return best_move, sign * best, ordered
+
+def aspiration_search(search, board, top_moves, depth, is_max_state, ctx, guess):
+    # Search a narrow window around guess and widen it until the score
+    # falls strictly inside.
+    delta = ASPIRATION_WINDOW
+    while delta < INFINITY:
+        alpha, beta = guess - delta, guess + delta
+        result = search(board, top_moves, depth, is_max_state, ctx, alpha, beta)
+        if alpha < result[1] < beta:
+            return result
+        delta *= 4
+    return search(board, top_moves, depth, is_max_state, ctx)
+
+def search_child(board, move, depth, alpha, beta, is_max_state, ctx):
+    # Value of playing move at the root, in absolute (max-positive) terms,
+    # searched inside the absolute window (alpha, beta).
+    board.push(move)
+    if ctx.algorithm == "minimax":
+        value = minimax(board, alpha, beta, depth - 1, not is_max_state, ctx)
+    elif is_max_state:
+        value = -pvs(board, -beta, -alpha, depth - 1, ctx)
+    else:
+        value = pvs(board, alpha, beta, depth - 1, ctx)
+    board.pop()
+    return value
+
+def best_of(scored, is_max_state, limit=9999):
+    # The first strictly best of scored, starting from -limit (limit when
+    # minimizing); minimax's root starts from 9999, PVS from INFINITY.
+    best_value = is_max_state and -limit or limit
+    best_move = (-1, -1)
+
+    for move, value in scored:
+        if ((is_max_state and value > best_value)
+                or (not is_max_state and value < best_value)):
+            best_value = value
+            best_move = move
+    if best_move[0] == -1 and best_move[1] == -1 and len(scored) > 0:
+        best_move = scored[0][0]
+
+    ordered = sorted(scored, key=lambda x: x[1], reverse=is_max_state)
+    return best_move, best_value, ordered
+
+def empty_count(state):
+    return int(np.count_nonzero(state.values == piece.EMPTY))
+
+def get_top_moves(board, n, is_max_state, difficulty="Medium", moves=None, eval_cache=None):
+    color = board.color
+    if moves is None:
+        moves = board.legal_moves()
+
+    if board.evaluator is not None:
+        evaluations = board.evaluator.score_moves(moves, -color, color, difficulty)
+    else:
+        evaluations = []
+        for move in moves:
+            board.push(move)
+            evaluations.append(evaluate(board, color, difficulty))
+            board.pop()
+    # The children's values are the leaves a search of them starts from.
+    if eval_cache is not None and difficulty != "Easy":
+        cache_children(eval_cache, board, moves, evaluations, difficulty)
+    top_moves = list(zip(moves, evaluations))
 
     return sorted(top_moves, key=lambda x: x[1], reverse=is_max_state)[:n]
 
 
-def minimax(state, alpha, beta, depth, is_max_state, difficulty="Medium"):
-    if depth == 0 or state.is_terminal():
-        return evaluation_state(state, -state.color, difficulty)
+def static_move(state, is_max_state, difficulty="Medium"):
+    # The statically best move for the side to move, for when there is no
+    # time left to search.
+    board = state.search_board(IncrementalEvaluator(state))
+    move = get_top_moves(board, 1, is_max_state, difficulty)[0][0]
+    return tuple(map(int, move))
+
+
+def cache_children(eval_cache, board, moves, values, difficulty):
+    # Stores the static values of board's children (the side to move
+    # playing each of moves) without making the moves.
+    size = board.size
+    table = zobrist_table(size)[-board.color]
+    key = board.hash ^ eval_keys(difficulty)[board.color]
+    for (i, j), value in zip(moves, values):
+        eval_cache.put(key ^ table[int(i) * size + int(j)], value)
+
 
-    if is_max_state:
+def minimax(board, alpha, beta, depth, is_max_state, ctx):
+    ctx.visit()
+    if depth == 0 or ctx.is_terminal(board):
+        return ctx.evaluate(board)
+
+    tt = ctx.tt
+    alpha_orig, beta_orig = alpha, beta
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(board)
+        if entry is not None:
+            hash_move = entry.move
+        if entry is not None and entry.depth >= depth:
+            if entry.flag == EXACT:
+                return entry.value
+            if entry.flag == LOWER:
+                alpha = max(alpha, entry.value)
+            else:
+                beta = min(beta, entry.value)
+            if alpha >= beta:
+                return entry.value
+
+    best_move = None
+    if depth == 1 and ctx.frontier:
+        # The exact value, where the loops below may stop at a cutoff with
+        # a bound; either is correct for the window.
+        value = is_max_state and -9999 or 9999
+        moves, values = ctx.evaluate_frontier(board)
+        for move, child in zip(moves, values):
+            if (is_max_state and child > value) or (not is_max_state and child < value):
+                value = child
+                best_move = move
+    elif is_max_state:
         value = -9999
-        for move in state.legal_moves():
-            value = max(
-                value,
-                minimax(state.next(move), alpha, beta, depth - 1, False, difficulty)
-            )
+        for index, move in enumerate(ctx.order_moves(board, hash_move, depth)):
+            reduction = ctx.reduction(board, move, index, depth)
+            board.push(move)
+            ctx.children += 1
+            child = None
+            if reduction:
+                child = minimax(board, alpha, alpha + 1, depth - 1 - reduction, False, ctx)
+            if child is None or child > alpha:
+                ctx.researches += child is not None
+                child = minimax(board, alpha, beta, depth - 1, False, ctx)
+            board.pop()
+            if child > value:
+                value = child
+                best_move = move
             alpha = max(value, alpha)
             if alpha >= beta:
+                ctx.cutoff(board, move, depth)
                 break
-        return value
     else:
         value = 9999
-        for move in state.legal_moves():
-            value = min(
-                value,
-                minimax(state.next(move), alpha, beta, depth - 1, True, difficulty)
-            )
+        for index, move in enumerate(ctx.order_moves(board, hash_move, depth)):
+            reduction = ctx.reduction(board, move, index, depth)
+            board.push(move)
+            ctx.children += 1
+            child = None
+            if reduction:
+                child = minimax(board, beta - 1, beta, depth - 1 - reduction, True, ctx)
+            if child is None or child < beta:
+                ctx.researches += child is not None
+                child = minimax(board, alpha, beta, depth - 1, True, ctx)
+            board.pop()
+            if child < value:
+                value = child
+                best_move = move
             beta = min(value, beta)
             if alpha >= beta:
+                ctx.cutoff(board, move, depth)
+                break
+
+    if tt is not None:
+        if value <= alpha_orig:
+            flag = UPPER
+        elif value >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(board, depth, value, flag, best_move)
+    return value
+
+
+def pvs(board, alpha, beta, depth, ctx):
+    # Negamax principal variation search; scores are from the point of view
+    # of the side to move. TT entries are stored in absolute terms so they
+    # mean the same as minimax's.
+    ctx.visit()
+    sign = ctx.sign(board)
+    if depth == 0 or ctx.is_terminal(board):
+        return sign * ctx.evaluate(board)
+
+    tt = ctx.tt
+    alpha_orig = alpha
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(board)
+        if entry is not None:
+            hash_move = entry.move
+        if entry is not None and entry.depth >= depth:
+            value, flag = relative_bound(entry.value, entry.flag, sign)
+            if flag == EXACT:
+                return value
+            if flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+    best = -INFINITY
+    best_move = None
+    if depth == 1 and ctx.frontier:
+        moves, values = ctx.evaluate_frontier(board)
+        for move, value in zip(moves, values):
+            if sign * value > best:
+                best = sign * value
+                best_move = move
+    else:
+        for index, move in enumerate(ctx.order_moves(board, hash_move, depth)):
+            reduction = ctx.reduction(board, move, index, depth)
+            board.push(move)
+            ctx.children += 1
+            if index == 0:
+                score = -pvs(board, -beta, -alpha, depth - 1, ctx)
+            else:
+                score = -pvs(board, -alpha - 1, -alpha, depth - 1 - reduction, ctx)
+                if reduction and score > alpha:
+                    ctx.researches += 1
+                    score = -pvs(board, -alpha - 1, -alpha, depth - 1, ctx)
+                if alpha < score < beta:
+                    score = -pvs(board, -beta, -score, depth - 1, ctx)
+            board.pop()
+
+            if score > best:
+                best = score
+                best_move = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                ctx.cutoff(board, move, depth)
                 break
-        return value
+
+    if tt is not None:
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        value, flag = relative_bound(best, flag, sign)
+        tt.store(board, depth, value, flag, best_move)
+    return best
+
+
+def relative_bound(value, flag, sign):
+    # Converts a bound between the absolute and side-to-move frames (the
+    # conversion is its own inverse).
+    if sign == 1:
+        return value, flag
+    if flag == LOWER:
+        flag = UPPER
+    elif flag == UPPER:
+        flag = LOWER
+    return -value, flag
+
+
+def evaluate(board, current_color, difficulty="Medium"):
+    if board.evaluator is None:
+        return evaluation_state(board, current_color, difficulty)
+    return board.evaluator.evaluate(current_color, difficulty)
 
 
 def first_move(state):
@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import piece
+from ai import get_best_move, search_kwargs
+from board import BoardState, from_snapshot
+from eval_fn import evaluation_state
+from transposition import options_table, worker_eval_cache
+
+# Streams finished games (JSON lines with "moves" and optionally "id" and
+# "size") through a process pool that searches every position and compares
+# the move played with the engine's choice. Output is one JSON line per
+# game, in input order:
+#   {"id": ..., "positions": [[ply, best_i, best_j, value, loss, depth], ...],
+#    "blunders": [ply, ...]}
+# value is the engine's score from black's point of view and loss what the
+# played move gave up from the mover's point of view. Records that cannot be
+# parsed or replayed get {"id": ..., "error": ...} instead.
+
+# Positions in flight (and games held back waiting for an earlier game to
+# finish) per worker; the reader blocks once the window is full.
+WINDOW_PER_WORKER = 4
+# Seconds between checkpoint writes.
+CHECKPOINT_INTERVAL = 5.0
+
+def checkpoint_path(output):
+    return output + ".checkpoint"
+
+
+def read_checkpoint(output):
+    path = checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(output, checkpoint):
+    # Written to a temporary file and renamed, so a crash leaves either the
+    # old checkpoint or the new one.
+    path = checkpoint_path(output)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_games(f, offset, number):
+    # Yields (game number, line, offset after the line) for every non-blank
+    # line from offset on.
+    f.seek(offset)
+    for line in iter(f.readline, b''):
+        offset += len(line)
+        if not line.strip():
+            continue
+        yield number, line, offset
+        number += 1
+
+
+def parse_record(line):
+    # One game record: {"moves": [[i, j], ...], "id": ..., "size": ...}, or
+    # a bare list of moves.
+    record = json.loads(line)
+    if isinstance(record, list):
+        record = {'moves': record}
+    if not isinstance(record, dict):
+        raise TypeError(f"expected a game object, got {type(record).__name__}")
+    return record
+
+
+def replay(size, moves, start):
+    # (ply, snapshot, played move) for every position from ply start on,
+    # stopping at the end of the game.
+    state = BoardState(size)
+    positions = []
+    for ply, move in enumerate(moves):
+        if state.is_terminal():
+            raise ValueError(f"move {ply} was played after the game ended")
+        if not (0 <= move[0] < size and 0 <= move[1] < size) or not state.is_valid_position(move):
+            raise ValueError(f"illegal move {ply}: {list(move)}")
+        if ply >= start:
+            positions.append((ply, state.snapshot(), move))
+        state = state.next(move)
+    return positions
+
+
+def search(state, depth, is_max_state, options):
+    info = {}
+    move, value, _ = get_best_move(state, depth, is_max_state, options['difficulty'],
+                                   options_table(options), options['time_budget'], info,
+                                   opening=False,
+                                   eval_cache=worker_eval_cache(options['eval_cache_size']),
+                                   **search_kwargs(options))
+    return tuple(map(int, move)), float(value), info['depth']
+
+
+def analyse_position(snapshot, played, options):
+    # Runs in a worker: the engine's move and value for the position, and
+    # the value of the move that was played (searched one ply less deep).
+    state = from_snapshot(snapshot)
+    is_max_state = -state.color == piece.BLACK
+    depth = options['depth']
+    move, value, searched = search(state, depth, is_max_state, options)
+    if move == played:
+        played_value = value
+    else:
+        child = state.next(played)
+        if child.is_terminal():
+            played_value = float(evaluation_state(child, -child.color, options['difficulty']))
+        else:
+            _, played_value, _ = search(child, max(depth - 1, 1), not is_max_state, options)
+    loss = (value - played_value) if is_max_state else (played_value - value)
+    return move, value, loss, searched
+
+
+class Game:
+    def __init__(self, number, game_id, offset, count):
+        self.number = number
+        self.id = game_id
+        # Input offset just after this game's record.
+        self.offset = offset
+        self.positions = [None] * count
+        self.remaining = count
+        self.error = None
+
+    def record(self, blunder):
+        if self.error is not None:
+            return {'id': self.id, 'error': self.error}
+        positions = [[ply, move[0], move[1], round(value, 1), round(loss, 1), depth]
+                     for ply, move, value, loss, depth in self.positions]
+        blunders = [row[0] for row in positions if row[4] >= blunder]
+        return {'id': self.id, 'positions': positions, 'blunders': blunders}
+
+
+class Pipeline:
+    # Keeps at most window positions in the pool and window games waiting
+    # to be written, so memory stays bounded however long the archive is.
+    # Games are written in input order, and the checkpoint records the
+    # input and output offsets after the last game written.
+    def __init__(self, executor, out, output, options, window, blunder, log=None):
+        self.executor = executor
+        self.out = out
+        self.output = output
+        self.options = options
+        self.window = window
+        self.blunder = blunder
+        self.log = log
+        self.pending = {}
+        self.games = deque()
+        self.written = 0
+        self.positions = 0
+        self.checkpoint = None
+        self.saved = time.time()
+
+    def add(self, game, positions):
+        self.games.append(game)
+        for index, (ply, snapshot, played) in enumerate(positions):
+            while len(self.pending) >= self.window:
+                self.drain()
+            future = self.executor.submit(analyse_position, snapshot, played, self.options)
+            self.pending[future] = (game, index, ply)
+        while len(self.games) >= self.window and self.pending:
+            self.drain()
+        self.flush()
+
+    def drain(self):
+        done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            game, index, ply = self.pending.pop(future)
+            move, value, loss, depth = future.result()
+            game.positions[index] = (ply, move, value, loss, depth)
+            game.remaining -= 1
+            self.positions += 1
+        self.flush()
+
+    def flush(self):
+        while self.games and self.games[0].remaining == 0:
+            game = self.games.popleft()
+            self.out.write(json.dumps(game.record(self.blunder), separators=(',', ':')).encode() + b'\n')
+            self.written += 1
+            self.checkpoint = {'input_offset': game.offset, 'games': game.number + 1}
+        if self.checkpoint is not None and time.time() - self.saved >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self):
+        if self.checkpoint is None:
+            return
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        self.checkpoint['output_offset'] = self.out.tell()
+        write_checkpoint(self.output, self.checkpoint)
+        self.saved = time.time()
+        if self.log is not None:
+            print(f"{self.checkpoint['games']} games, {self.positions} positions", file=self.log)
+        self.checkpoint = None
+
+    def finish(self):
+        while self.pending:
+            self.drain()
+        self.save()
+
+
+def analyse(input_path, output, options, size=15, start=1, workers=None, window=None,
+            blunder=1000.0, resume=False, log=None):
+    # Analyses every game of input_path into output; with resume, carries
+    # on from output's checkpoint. Returns (games written, positions).
+    if resume:
+        checkpoint = read_checkpoint(output)
+    else:
+        # A fresh run rewrites output from the start; a checkpoint left by an
+        # earlier run would point into the old output.
+        checkpoint = None
+        if os.path.exists(checkpoint_path(output)):
+            os.remove(checkpoint_path(output))
+    if checkpoint is None:
+        checkpoint = {'input_offset': 0, 'output_offset': 0, 'games': 0}
+    workers = workers or os.cpu_count() or 1
+    window = window or WINDOW_PER_WORKER * workers
+
+    mode = 'r+b' if os.path.exists(output) else 'wb'
+    with open(input_path, 'rb') as f, open(output, mode) as out, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        # Drop anything written after the checkpoint; those games are redone.
+        out.truncate(checkpoint['output_offset'])
+        out.seek(checkpoint['output_offset'])
+        pipeline = Pipeline(executor, out, output, options, window, blunder, log)
+        for number, line, offset in read_games(f, checkpoint['input_offset'], checkpoint['games']):
+            game_id = number
+            try:
+                record = parse_record(line)
+                game_id = record.get('id', number)
+                moves = [(int(i), int(j)) for i, j in record['moves']]
+                positions = replay(int(record.get('size', size)), moves, start)
+            except (json.JSONDecodeError, KeyError, TypeError, IndexError, ValueError) as e:
+                positions = []
+                game = Game(number, game_id, offset, 0)
+                game.error = f"{type(e).__name__}: {e}"
+            else:
+                game = Game(number, game_id, offset, len(positions))
+            pipeline.add(game, positions)
+        pipeline.finish()
+    return pipeline.written, pipeline.positions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse an archive of Gomoku games")
+    parser.add_argument('input', help="JSON lines of games ({\"moves\": [[i, j], ...]})")
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--size', type=int, default=15, help="board size of games without one")
+    parser.add_argument('--depth', type=int, default=3,
+                        help="search depth (the maximum depth with --time-budget)")
+    parser.add_argument('--time-budget', type=float, default=None, help="seconds per search")
+    parser.add_argument('--difficulty', default="Hard", choices=["Medium", "Hard"])
+    parser.add_argument('--algorithm', default="pvs", choices=["pvs", "minimax"])
+    parser.add_argument('--threat-budget', type=int, default=1000)
+    parser.add_argument('--tt-size', type=int, default=1 << 16)
+    parser.add_argument('--tt-policy', default="depth", choices=["depth", "lru"])
+    parser.add_argument('--tt-symmetry', action='store_true',
+                        help="share transposition entries between symmetric positions")
+    parser.add_argument('--lmr', action='store_true')
+    parser.add_argument('--widths', type=int, nargs='+', default=None)
+    parser.add_argument('--frontier', action='store_true',
+                        help="score the children of depth-1 nodes in one batch")
+    parser.add_argument('--eval-cache-size', type=int, default=1 << 24,
+                        help="bytes of leaf evaluations each worker keeps (0 disables)")
+    parser.add_argument('--start', type=int, default=1, help="first ply to analyse")
+    parser.add_argument('--blunder', type=float, default=1000.0,
+                        help="loss at which a move is flagged as a blunder")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--window', type=int, default=None,
+                        help=f"positions in flight (default {WINDOW_PER_WORKER} per worker)")
+    parser.add_argument('--resume', action='store_true', help="continue from the checkpoint")
+    args = parser.parse_args(argv)
+
+    options = {
+        'depth': args.depth,
+        'time_budget': args.time_budget,
+        'difficulty': args.difficulty,
+        'algorithm': args.algorithm,
+        'threat_budget': args.threat_budget,
+        'tt_size': args.tt_size,
+        'tt_policy': args.tt_policy,
+        'tt_symmetry': args.tt_symmetry,
+        'lmr': args.lmr,
+        'widths': args.widths,
+        'frontier': args.frontier,
+        'eval_cache_size': args.eval_cache_size,
+        'timers': False,
+    }
+    started = time.time()
+    games, positions = analyse(args.input, args.output, options, args.size, args.start,
+                               args.workers, args.window, args.blunder, args.resume, sys.stderr)
+    elapsed = time.time() - started
+    print(f"{games} games, {positions} positions in {elapsed:.1f}s "
+          f"({positions / elapsed if elapsed else 0.0:.1f} positions/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+import argparse
+import json
+import random
+import resource
+import sys
+import time
+import numpy as np
+import piece
+from ai import get_best_move
+from board import BoardState
+from game import GameRunner
+from transposition import TranspositionTable
+
+# Fixed tactical positions: stones of each color, the side to move is the
+# color with fewer stones (black on a tie), and the moves that solve it.
+TACTICAL_POSITIONS = [
+    {
+        'name': 'win-in-one',
+        'size': 15,
+        'black': [(7, 5), (7, 6), (7, 7), (7, 8)],
+        'white': [(6, 5), (6, 6), (6, 7), (8, 8)],
+        'solutions': [(7, 4), (7, 9)],
+    },
+    {
+        'name': 'block-four',
+        'size': 15,
+        'black': [(7, 7), (8, 8), (9, 6), (3, 3)],
+        'white': [(5, 4), (5, 5), (5, 6), (5, 7), (4, 8)],
+        'solutions': [(5, 3), (5, 8)],
+    },
+    {
+        'name': 'block-open-three',
+        'size': 15,
+        'black': [(7, 7), (9, 9), (3, 12)],
+        'white': [(8, 4), (8, 5), (8, 6)],
+        'solutions': [(8, 3), (8, 7), (8, 2), (8, 8)],
+    },
+    {
+        'name': 'diagonal-win-19',
+        'size': 19,
+        'black': [(5, 5), (6, 6), (7, 7), (8, 8), (12, 3)],
+        'white': [(4, 4), (9, 10), (10, 9), (3, 15), (15, 2)],
+        'solutions': [(9, 9)],
+    },
+]
+
+
+# Stones on the board when measuring the memory of a position.
+POSITION_STONES = 30
+# Attributes holding tables shared between positions (see position_bytes).
+SHARED_ATTRIBUTES = ('neighbors', 'layout')
+
+
+def position_state(position):
+    black = list(position['black'])
+    white = list(position['white'])
+    state = BoardState(position['size'])
+    first, second = (black, white) if len(black) >= len(white) else (white, black)
+    if first is white:
+        state.color = piece.BLACK
+    for k in range(len(first)):
+        state = state.next(first[k])
+        if k < len(second):
+            state = state.next(second[k])
+    return state
+
+
+def random_position(size, stones, seed=0, radius=1, backend="numpy"):
+    # stones seeded random moves from the centre, each next to the stones
+    # already played.
+    rng = random.Random(seed)
+    state = BoardState(size, radius=radius, backend=backend)
+    state = state.next((size // 2, size // 2))
+    for _ in range(stones - 1):
+        state = state.next(rng.choice(state.legal_moves()))
+    return state
+
+
+def position_bytes(state):
+    # Memory one BoardState holds on its own. The tables every position of
+    # a size shares (candidate neighbours, bitboard layout) are left out.
+    seen = set()
+
+    def size_of(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(size_of(key) + size_of(value) for key, value in obj.items()
+                         if key not in SHARED_ATTRIBUTES)
+        elif isinstance(obj, (list, tuple, set)):
+            total += sum(size_of(item) for item in obj)
+        elif hasattr(obj, '__dict__'):
+            total += size_of(obj.__dict__)
+        return total
+
+    return size_of(state)
+
+
+def run_positions(sizes, radius, backend, seed):
+    results = []
+    for size in sizes:
+        state = random_position(size, POSITION_STONES, seed, radius, backend)
+        results.append({'size': size, 'bytes': position_bytes(state)})
+    return results
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_rss_kb(who=resource.RUSAGE_SELF):
+    # With RUSAGE_CHILDREN, the peak of the largest worker process that has
+    # exited (runners shut their root-search pools down when closed).
+    return resource.getrusage(who).ru_maxrss
+
+
+def play_game(runner, max_moves):
+    # Both sides are played by the AI: swap which color GameRunner thinks
+    # it owns after every move.
+    runner.restart(player_index=-1)
+    records = []
+    for _ in range(max_moves):
+        if runner.finished or runner.state.is_full():
+            break
+        move_time = runner.aiplay()
+        records.append({'time': move_time, 'nodes': runner.last_search.get('nodes', 0),
+                        'depth': runner.last_search.get('depth', 0)})
+        runner.ai_color = -runner.ai_color
+        runner.is_max_state = not runner.is_max_state
+    return records
+
+
+def run_selfplay(size, difficulty, games, max_moves, seed, options):
+    times = []
+    nodes = 0
+    depths = []
+    probes = hits = 0
+    eval_hits = eval_misses = 0
+    for game in range(games):
+        np.random.seed(seed + game)
+        runner = GameRunner(size=size, difficulty=difficulty, **options)
+        try:
+            records = play_game(runner, max_moves)
+        finally:
+            runner.close()
+        times.extend(r['time'] for r in records)
+        nodes += sum(r['nodes'] for r in records)
+        depths.extend(r['depth'] for r in records if r['depth'])
+        if runner.tt is not None:
+            probes += runner.tt.probes
+            hits += runner.tt.hits
+        if runner.eval_cache is not None:
+            eval_hits += runner.eval_cache.hits
+            eval_misses += runner.eval_cache.misses
+
+    total_time = sum(times)
+    return {
+        'size': size,
+        'difficulty': difficulty,
+        'games': games,
+        'moves': len(times),
+        'nodes': nodes,
+        'nodes_per_sec': nodes / total_time if total_time else 0.0,
+        'latency': {
+            'mean': total_time / len(times) if times else 0.0,
+            'p50': percentile(times, 50),
+            'p95': percentile(times, 95),
+            'p99': percentile(times, 99),
+            'max': max(times) if times else 0.0,
+        },
+        'mean_depth': float(np.mean(depths)) if depths else 0.0,
+        'tt_hit_rate': hits / probes if probes else 0.0,
+        'eval_hit_rate': eval_hits / (eval_hits + eval_misses) if eval_hits + eval_misses else 0.0,
+    }
+
+
+def run_tactical(depth, difficulty, repeat, time_budget=None, threat_budget=None,
+                 algorithm="pvs", lmr=False, widths=None, frontier=False):
+    results = []
+    for position in TACTICAL_POSITIONS:
+        state = position_state(position)
+        is_max_state = state.color == piece.WHITE
+        times = []
+        info = {}
+        for _ in range(repeat):
+            info = {}
+            tt = TranspositionTable()
+            move, value, elapsed = get_best_move(state, depth, is_max_state, difficulty,
+                                                 tt, time_budget, info,
+                                                 threat_budget=threat_budget,
+                                                 algorithm=algorithm, lmr=lmr,
+                                                 widths=widths, frontier=frontier)
+            times.append(elapsed)
+        move = tuple(map(int, move))
+        results.append({
+            'name': position['name'],
+            'size': position['size'],
+            'time': min(times),
+            'nodes': info.get('nodes', 0),
+            'move': list(move),
+            'solved': move in [tuple(m) for m in position['solutions']],
+        })
+    return results
+
+
+def run(args):
+    options = {
+        'tt_size': args.tt_size,
+        'tt_symmetry': args.tt_symmetry,
+        'radius': args.radius,
+        'backend': args.backend,
+        'time_budget': args.time_budget,
+        'workers': args.workers,
+        'threat_budget': args.threat_budget,
+        'algorithm': args.algorithm,
+        'lmr': args.lmr,
+        'widths': args.widths,
+        'frontier': args.frontier,
+        'eval_cache_size': args.eval_cache_size,
+        'book': args.book,
+    }
+    started = time.time()
+    report = {
+        'config': vars(args),
+        'selfplay': [],
+        'tactical': [],
+    }
+    for size in args.sizes:
+        for difficulty in args.difficulties:
+            result = run_selfplay(size, difficulty, args.games, args.moves, args.seed, options)
+            report['selfplay'].append(result)
+            print(f"{size}x{size} {difficulty}: {result['moves']} moves, "
+                  f"{result['nodes_per_sec']:.0f} nodes/s, "
+                  f"p95 {result['latency']['p95']:.3f}s", file=sys.stderr)
+    report['tactical'] = run_tactical(args.tactical_depth, "Hard", args.repeat,
+                                      args.time_budget, args.threat_budget, args.algorithm,
+                                      args.lmr, args.widths, args.frontier)
+    report['positions'] = run_positions(args.sizes, args.radius, args.backend, args.seed)
+    report['peak_rss_kb'] = peak_rss_kb()
+    report['peak_worker_rss_kb'] = peak_rss_kb(resource.RUSAGE_CHILDREN)
+    report['wall_time'] = time.time() - started
+    return report
+
+
+def compare(baseline, current, threshold):
+    # Returns the list of metrics that got worse by more than threshold.
+    # A metric missing from either report (e.g. one written before it was
+    # measured) is not compared.
+    regressions = []
+
+    def check(name, old, new, higher_is_better=False):
+        if not old or new is None:
+            return
+        change = (new - old) / old
+        if higher_is_better:
+            change = -change
+        if change > threshold:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+
+    old_selfplay = {(r['size'], r['difficulty']): r for r in baseline.get('selfplay', [])}
+    for result in current.get('selfplay', []):
+        old = old_selfplay.get((result['size'], result['difficulty']))
+        if old is None:
+            continue
+        name = f"{result['size']}x{result['size']} {result['difficulty']}"
+        check(f"{name} nodes/s", old['nodes_per_sec'], result['nodes_per_sec'], True)
+        for q in ('p50', 'p95', 'p99'):
+            check(f"{name} {q} latency", old['latency'][q], result['latency'][q])
+
+    old_tactical = {r['name']: r for r in baseline.get('tactical', [])}
+    for result in current.get('tactical', []):
+        old = old_tactical.get(result['name'])
+        if old is None:
+            continue
+        check(f"tactical {result['name']} time", old['time'], result['time'])
+        if old['solved'] and not result['solved']:
+            regressions.append(f"tactical {result['name']}: no longer solved")
+
+    old_positions = {r['size']: r for r in baseline.get('positions', [])}
+    for result in current.get('positions', []):
+        old = old_positions.get(result['size'])
+        if old is not None:
+            check(f"{result['size']}x{result['size']} position bytes", old['bytes'], result['bytes'])
+
+    check("peak RSS", baseline.get('peak_rss_kb'), current.get('peak_rss_kb'))
+    check("peak worker RSS", baseline.get('peak_worker_rss_kb'), current.get('peak_worker_rss_kb'))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Gomoku engine benchmark")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="play seeded AI-vs-AI games and time tactical positions")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[9, 15, 19])
+    run_parser.add_argument('--difficulties', nargs='+', default=["Medium", "Hard"])
+    run_parser.add_argument('--games', type=int, default=2)
+    run_parser.add_argument('--moves', type=int, default=30)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--tactical-depth', type=int, default=3)
+    run_parser.add_argument('--tt-size', type=int, default=1 << 18)
+    run_parser.add_argument('--tt-symmetry', action='store_true',
+                            help="share transposition entries between symmetric positions")
+    run_parser.add_argument('--radius', type=int, default=1,
+                            help="candidate moves are empty cells within this many steps of "
+                                 "a stone along a row, column or diagonal")
+    run_parser.add_argument('--backend', default="numpy", choices=["numpy", "bitboard"])
+    run_parser.add_argument('--time-budget', type=float, default=None)
+    run_parser.add_argument('--workers', type=int, default=1)
+    run_parser.add_argument('--threat-budget', type=int, default=1000)
+    run_parser.add_argument('--algorithm', default="pvs", choices=["pvs", "minimax"])
+    run_parser.add_argument('--lmr', action='store_true', help="reduce late quiet moves")
+    run_parser.add_argument('--widths', type=int, nargs='+', default=None,
+                            help="moves searched at each ply from the root (the last repeats)")
+    run_parser.add_argument('--frontier', action='store_true',
+                            help="score the children of depth-1 nodes in one batch")
+    run_parser.add_argument('--eval-cache-size', type=int, default=1 << 24,
+                            help="bytes of leaf evaluations to keep (0 disables)")
+    run_parser.add_argument('--book', action='store_true', help="let self-play use the opening books")
+    run_parser.add_argument('--output', default=None, help="write the JSON report here")
+    run_parser.add_argument('--baseline', default=None, help="fail if worse than this report")
+    run_parser.add_argument('--threshold', type=float, default=0.2)
+
+    compare_parser = sub.add_parser('compare', help="compare two saved reports")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+        if args.baseline is None:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        current = report
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
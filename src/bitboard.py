@@ -0,0 +1,157 @@
+import piece
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from eval_fn import evaluate_line
+from lines import line_indices
+
+Layout = namedtuple('Layout', 'offsets lengths cell_masks cell_bits bit_cells full')
+
+# Bits of a line on each side of a cell that a five or a tactical pattern
+# through it can reach.
+REACH = 4
+
+
+@lru_cache(maxsize=None)
+def line_layout(size):
+    # Every line of line_indices packed one after another into a single
+    # integer with a zero bit between lines, so rows, columns and both
+    # diagonals share one bitboard per color and a pattern can never match
+    # across two lines.
+    offsets = []
+    lengths = []
+    cell_masks = [0] * (size * size)
+    bit_cells = []
+    pos = 0
+    for line in line_indices(size):
+        offsets.append(pos)
+        lengths.append(len(line))
+        for t, k in enumerate(line):
+            cell_masks[k] |= 1 << (pos + t)
+        bit_cells.extend(line)
+        bit_cells.append(-1)
+        pos += len(line) + 1
+
+    full = 0
+    for mask in cell_masks:
+        full |= mask
+    cell_bits = tuple(tuple(p for p in range(mask.bit_length()) if mask >> p & 1)
+                      for mask in cell_masks)
+    return Layout(tuple(offsets), tuple(lengths), tuple(cell_masks), cell_bits,
+                  tuple(bit_cells), full)
+
+
+def match(pattern, own, empty):
+    # Bit p of the result is set when pattern starts at bit p.
+    m = -1
+    for t, ch in enumerate(pattern):
+        m &= (own if ch == 'x' else empty) >> t
+    return m
+
+
+def window(bits, p):
+    # The 2 * REACH + 1 bits around bit p, with p at bit REACH; bits past
+    # the start of the board read as 0.
+    if p >= REACH:
+        return bits >> (p - REACH) & 0x1FF
+    return bits << (REACH - p) & 0x1FF
+
+
+@lru_cache(maxsize=1 << 16)
+def window_tactical(own, empty):
+    # Whether a stone on the (empty) middle cell of a window makes a four or
+    # an open three for the color of own, or takes the square that color
+    # needs for one: a five-cell stretch through it with 3 or 4 stones and
+    # no opponent, or _????_ around it with 2 stones and the rest empty.
+    free = own | empty
+    for s in range(REACH + 1):
+        mask = 0x1F << s
+        if free & mask == mask and (own & mask).bit_count() >= 3:
+            return True
+    for s in range(REACH):
+        middle = 0xF << (s + 1)
+        if (empty >> s & 1 and empty >> (s + 5) & 1 and free & middle == middle
+                and (own & middle).bit_count() == 2):
+            return True
+    return False
+
+
+@lru_cache(maxsize=1 << 16)
+def line_score(own, opp, length, current):
+    line = [(own >> t & 1) - (opp >> t & 1) for t in range(length)]
+    return evaluate_line(line, piece.BLACK, current)
+
+
+class BitBoard:
+    def __init__(self, size, values=None):
+        self.size = size
+        self.layout = line_layout(size)
+        self.stones = {piece.BLACK: 0, piece.WHITE: 0}
+
+        if values is not None:
+            for k, value in enumerate(np.asarray(values).flatten().tolist()):
+                if value != piece.EMPTY:
+                    self.add(k, value)
+
+    def copy(self):
+        other = BitBoard.__new__(BitBoard)
+        other.size = self.size
+        other.layout = self.layout
+        other.stones = dict(self.stones)
+        return other
+
+    def add(self, k, color):
+        self.stones[color] |= self.layout.cell_masks[k]
+
+    def remove(self, k, color):
+        self.stones[color] &= ~self.layout.cell_masks[k]
+
+    def empty(self):
+        return self.layout.full & ~(self.stones[piece.BLACK] | self.stones[piece.WHITE])
+
+    def has_five(self, color):
+        return match('xxxxx', self.stones[color], 0) != 0
+
+    def five_through(self, k, color):
+        # Whether color has five in a row through cell k; only the (up to 4)
+        # lines through k are looked at.
+        own = self.stones[color]
+        for p in self.layout.cell_bits[k]:
+            run = window(own, p)
+            if run & run >> 1 & run >> 2 & run >> 3 & run >> 4:
+                return True
+        return False
+
+    def tactical(self, k):
+        # threats.is_tactical for the empty cell k, from the lines through k.
+        black = self.stones[piece.BLACK]
+        white = self.stones[piece.WHITE]
+        empty = self.empty()
+        for p in self.layout.cell_bits[k]:
+            b, w, e = window(black, p), window(white, p), window(empty, p)
+            if window_tactical(b, e) or window_tactical(w, e):
+                return True
+        return False
+
+    def cells(self, pattern, color, offset):
+        # Board cells at index offset of every match of pattern, e.g. the
+        # square that completes a four with ('xxxx_', color, 4).
+        m = match(pattern, self.stones[color], self.empty()) << offset
+        bit_cells = self.layout.bit_cells
+        found = set()
+        while m:
+            low = m & -m
+            found.add(bit_cells[low.bit_length() - 1])
+            m ^= low
+        return found
+
+    def evaluate_color(self, color, current_color):
+        own = self.stones[color]
+        opp = self.stones[-color]
+        current = color == current_color
+        evaluation = 0
+        for offset, length in zip(self.layout.offsets, self.layout.lengths):
+            mask = (1 << length) - 1
+            evaluation += line_score(own >> offset & mask, opp >> offset & mask,
+                                     length, current)
+        return evaluation * color
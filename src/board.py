@@ -1,19 +1,55 @@
 import numpy as np
 import piece
+from functools import lru_cache
+from zobrist import canonical, symmetric_keys, symmetric_zobrist
+from bitboard import BitBoard
+
+# Cells are stored as int8, one byte each; CELL_SYMBOLS maps those bytes
+# to piece.symbols for the text form of a board.
+CELL_SYMBOLS = bytes.maketrans(bytes(value & 0xFF for value in piece.symbols),
+                               ''.join(piece.symbols.values()).encode())
+# Added to a cell's CandidateSet count while a stone is on it; neighbour
+# counts stay below it.
+OCCUPIED = 128
 
 
 class BoardState:
-    def __init__(self, size, values=None, evals=None, color=piece.WHITE):
+    def __init__(self, size, values=None, evals=None, color=piece.WHITE, hashes=None,
+                 radius=1, candidates=None, backend="numpy", bits=None):
         if np.all(values != None):         
-            self.values = np.copy(values)
+            self.values = np.array(values, dtype=np.int8)
         else:
-            self.values = np.full((size, size), piece.EMPTY) 
+            self.values = np.full((size, size), piece.EMPTY, dtype=np.int8) 
+
+        # Zobrist keys of the position under the 8 board symmetries;
+        # hashes[0] is the plain key.
+        if hashes is None:
+            hashes = symmetric_keys(self.values)
+        self.hashes = list(hashes)
+        self.hash = self.hashes[0]
+
+        self.radius = radius
+        self._candidates = candidates
+
+        if bits is None and backend == "bitboard":
+            bits = BitBoard(size, self.values)
+        elif backend not in ("numpy", "bitboard"):
+            raise ValueError(f"Unknown board backend: {backend}")
+        self.bits = bits
 
         self.size = size
         self.color = color 
         self.last_move = None 
         self.winner = 0 
 
+    @property
+    def candidates(self):
+        # Built on first use, so positions that are only stored or shipped
+        # to workers do not carry one.
+        if self._candidates is None:
+            self._candidates = CandidateSet(self.size, self.values, self.radius)
+        return self._candidates
+
     def value(self, position):
         return self.values[position]
 
@@ -22,14 +58,33 @@ class BoardState:
                 and self.values[position] == piece.EMPTY)
 
     def legal_moves(self):
-        prev_move_idxs = self.values != piece.EMPTY
-        area_idxs = expand_area(self.size, prev_move_idxs)
-        return np.column_stack(np.where(area_idxs == True))
+        return self.candidates.moves()
+
+    def cells(self):
+        # The board as one string of piece.symbols, row by row.
+        return self.values.tobytes().translate(CELL_SYMBOLS).decode('ascii')
+
+    def snapshot(self):
+        # Compact picklable copy for shipping a position to worker processes.
+        return (self.size, self.values.tobytes(), self.color,
+                self.last_move, self.radius,
+                "numpy" if self.bits is None else "bitboard")
+
+    def canonical_hash(self):
+        # (key, t): the same key for all 8 symmetric variants of the
+        # position, and the transform that maps this one onto it.
+        return canonical(self.hashes)
+
+    def search_board(self, evaluator=None):
+        return SearchBoard(self, evaluator)
 
     def next(self, position):
         next_state = BoardState(size=self.size,
                                 values=self.values,
-                                color=-self.color)
+                                color=-self.color,
+                                hashes=self.hashes,
+                                radius=self.radius,
+                                bits=self.bits and self.bits.copy())
         next_state[position] = next_state.color 
         next_state.last_move = tuple(position)
         return next_state
@@ -42,6 +97,27 @@ class BoardState:
         return is_win
 
     def check_five_in_a_row(self):
+        if self.last_move is not None:
+            color = self[self.last_move]
+            if color == piece.EMPTY:
+                return False, piece.EMPTY
+            if self.bits is not None:
+                i, j = self.last_move
+                is_win = self.bits.five_through(int(i) * self.size + int(j), color)
+            else:
+                is_win = is_five(self.values, self.last_move)
+            if is_win:
+                self.winner = color
+                return True, color
+            return False, piece.EMPTY
+
+        if self.bits is not None:
+            for color in (piece.BLACK, piece.WHITE):
+                if self.bits.has_five(color):
+                    self.winner = color
+                    return True, color
+            return False, piece.EMPTY
+
         pattern = np.full((5,), 1)
 
         black_win = self.check_pattern(pattern * piece.BLACK)
@@ -85,8 +161,28 @@ class BoardState:
 
     def __setitem__(self, position, value):
         i, j = position
+        old = self.values[i, j]
         self.values[i, j] = value
 
+        k = int(i) * self.size + int(j)
+        table = symmetric_zobrist(self.size)
+        if old != piece.EMPTY:
+            self.hashes = [h ^ z for h, z in zip(self.hashes, table[old][k])]
+        if value != piece.EMPTY:
+            self.hashes = [h ^ z for h, z in zip(self.hashes, table[value][k])]
+        self.hash = self.hashes[0]
+        if self._candidates is not None:
+            if old == piece.EMPTY and value != piece.EMPTY:
+                self._candidates.add(k)
+            elif old != piece.EMPTY and value == piece.EMPTY:
+                self._candidates.remove(k)
+
+        if self.bits is not None:
+            if old != piece.EMPTY:
+                self.bits.remove(k, old)
+            if value != piece.EMPTY:
+                self.bits.add(k, value)
+
     def __str__(self):
         out = ' ' * 3
         out += '{}\n'.format(''.join(
@@ -112,32 +208,134 @@ class BoardState:
         return self.__str__()
 
 
+def from_snapshot(snapshot):
+    size, buffer, color, last_move, radius, backend = snapshot
+    # A read-only view of the buffer; BoardState takes its own copy.
+    values = np.frombuffer(buffer, dtype=np.int8).reshape(size, size)
+    state = BoardState(size, values=values, color=color, radius=radius, backend=backend)
+    state.last_move = last_move
+    return state
+
+
+class SearchBoard(BoardState):
+    # Mutable board for the search: push/pop play and take back a move in
+    # place instead of copying the values array for every node.
+    def __init__(self, state, evaluator=None):
+        super().__init__(state.size,
+                         values=state.values,
+                         color=state.color,
+                         hashes=state.hashes,
+                         radius=state.radius,
+                         candidates=state.candidates.copy(),
+                         bits=state.bits and state.bits.copy())
+        self.last_move = state.last_move
+        self.winner = state.winner
+        self.evaluator = evaluator
+        self.history = []
+
+    def push(self, position):
+        i, j = int(position[0]), int(position[1])
+        color = -self.color
+        self.history.append((self.last_move, self.winner))
+
+        self[i, j] = color
+        self.color = color
+        self.last_move = (i, j)
+
+        if self.evaluator is not None:
+            self.evaluator.move((i, j), color)
+
+    def pop(self):
+        i, j = self.last_move
+        self.last_move, self.winner = self.history.pop()
+
+        self[i, j] = piece.EMPTY
+        self.color = -self.color
+
+        if self.evaluator is not None:
+            self.evaluator.undo()
+
+
+class CandidateSet:
+    # Empty cells within radius of a stone along the 8 line directions.
+    # Each stone increments a neighbour count, so placing or removing a
+    # stone costs O(radius) instead of rescanning the board. counts holds
+    # one byte per cell: the neighbour count, plus OCCUPIED under a stone,
+    # so a copy for the next position is a single bytearray.
+    def __init__(self, size, values=None, radius=1):
+        self.size = size
+        self.radius = radius
+        self.neighbors = neighbor_cells(size, radius)
+        if max(map(len, self.neighbors)) >= OCCUPIED:
+            raise ValueError(f"Candidate radius too large: {radius}")
+        self.counts = bytearray(size * size)
+
+        if values is not None:
+            for k, value in enumerate(np.asarray(values).flatten().tolist()):
+                if value != piece.EMPTY:
+                    self.add(k)
+
+    def copy(self):
+        other = CandidateSet.__new__(CandidateSet)
+        other.size = self.size
+        other.radius = self.radius
+        other.neighbors = self.neighbors
+        other.counts = self.counts[:]
+        return other
+
+    def add(self, k):
+        counts = self.counts
+        counts[k] += OCCUPIED
+        for n in self.neighbors[k]:
+            counts[n] += 1
+
+    def remove(self, k):
+        counts = self.counts
+        counts[k] -= OCCUPIED
+        for n in self.neighbors[k]:
+            counts[n] -= 1
+
+    def flat(self):
+        # Flat indices of the candidates, ascending.
+        counts = np.frombuffer(self.counts, dtype=np.uint8)
+        return np.flatnonzero((counts != 0) & (counts < OCCUPIED))
+
+    def moves(self):
+        size = self.size
+        return [divmod(k, size) for k in self.flat().tolist()]
+
+    def __len__(self):
+        return len(self.flat())
+
+
 def issub(l, subl):
     l_size = len(l)
     subl_size = len(subl)
-    for i in range(l_size - subl_size):
-        curr = l[i:min(i + subl_size, l_size - 1)]
+    for i in range(l_size - subl_size + 1):
+        curr = l[i:i + subl_size]
         if (curr == subl).all():
             return True
     return False    
 
 
-def expand_area(size, idxs):
-    area_idxs = np.copy(idxs)
-    for i in range(size):
-        for j in range(size):
-            if not idxs[i, j]:
-                continue
-
-            for direction in ((1, 0), (0, 1), (1, 1), (1, -1)):
-                di, dj = direction
-                for side in (1, -1):
-                    ni = i + di * side
-                    nj = j + dj * side
-                    if not is_valid_position(size, (ni, nj)):
-                        continue
-                    area_idxs[ni, nj] = True
-    return np.bitwise_xor(area_idxs, idxs)
+def is_five(values, position):
+    # Only a five through the last stone can have been created by it, so
+    # count the run through position in each of the 4 directions.
+    size = len(values)
+    i, j = position
+    color = values[i, j]
+    for di, dj in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        count = 1
+        for side in (1, -1):
+            ni = i + di * side
+            nj = j + dj * side
+            while 0 <= ni < size and 0 <= nj < size and values[ni, nj] == color:
+                count += 1
+                ni += di * side
+                nj += dj * side
+        if count >= 5:
+            return True
+    return False
 
 
 def is_valid_position(board_size, position):
@@ -145,3 +343,25 @@ def is_valid_position(board_size, position):
         return False
     i, j = position
     return i >= 0 and i < board_size and j >= 0 and j < board_size
+
+
+@lru_cache(maxsize=None)
+def neighbor_cells(size, radius=1):
+    # Flat indices of the cells within radius of each flat index along the
+    # 8 line directions: radius=1 is the ring of 8 adjacent cells, radius=2
+    # a star of 16 cells rather than the 5x5 square. Only cells on a line
+    # through a stone can join it in a row, so the knight's-move and other
+    # off-line cells of the square are left out.
+    neighbors = []
+    for i in range(size):
+        for j in range(size):
+            cells = []
+            for di, dj in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                for side in (1, -1):
+                    for step in range(1, radius + 1):
+                        ni = i + di * side * step
+                        nj = j + dj * side * step
+                        if is_valid_position(size, (ni, nj)):
+                            cells.append(ni * size + nj)
+            neighbors.append(tuple(cells))
+    return tuple(neighbors)
@@ -0,0 +1,155 @@
+import argparse
+import os
+import random
+import struct
+import sys
+import numpy as np
+import piece
+from ai import get_best_move
+from board import BoardState
+from transposition import TranspositionTable
+from zobrist import inverse_transform, transform
+
+# A book file is a small header followed by records sorted by key. Keys are
+# symmetry-canonical Zobrist keys and moves are stored in the canonical
+# frame, so one record serves all 8 symmetric variants of a position.
+MAGIC = b"GMKB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+RECORD = np.dtype([('key', '<u8'), ('move', '<u2'), ('value', '<f4')])
+
+BOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "books")
+
+
+def book_path(size, directory=BOOK_DIR):
+    return os.path.join(directory, f"opening_{size}.book")
+
+
+class OpeningBook:
+    # Read-only view of a book file. The records are memory-mapped, so
+    # opening a book reads only the header and a lookup is a binary search
+    # over the mapped keys.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, version, size, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        self.path = path
+        self.size = size
+        if count:
+            self.records = np.memmap(path, dtype=RECORD, mode='r',
+                                     offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD)
+        self.keys = self.records['key']
+
+    def __len__(self):
+        return len(self.records)
+
+    def lookup(self, state):
+        # (move, value) for the side to move in state, or None.
+        if state.size != self.size or not len(self.records):
+            return None
+        key, t = state.canonical_hash()
+        index = int(np.searchsorted(self.keys, np.uint64(key)))
+        if index == len(self.keys) or int(self.keys[index]) != key:
+            return None
+        record = self.records[index]
+        move = int(record['move'])
+        move = transform(self.size, (move // self.size, move % self.size), inverse_transform(t))
+        if state.values[move] != piece.EMPTY:
+            return None
+        return move, float(record['value'])
+
+    def close(self):
+        self.records = self.keys = None
+
+
+def load_book(size, directory=BOOK_DIR):
+    # The book for this board size, or None when there isn't one.
+    path = book_path(size, directory)
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def write_book(path, size, entries):
+    # entries maps canonical key -> (canonical move, value).
+    records = np.zeros(len(entries), dtype=RECORD)
+    for n, key in enumerate(sorted(entries)):
+        (i, j), value = entries[key]
+        records[n] = (key, i * size + j, value)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, size, len(records)))
+        f.write(records.tobytes())
+
+
+def build_book(size, games=20, plies=8, depth=6, difficulty="Hard", time_budget=2.0,
+               explore=0.3, seed=0, entries=None, log=None):
+    # Self-play from the empty board, searching every position not yet in
+    # the book. With probability explore a side plays a random candidate
+    # instead of the book move so that games branch into new lines.
+    rng = random.Random(seed)
+    entries = {} if entries is None else entries
+    for game in range(games):
+        np.random.seed(seed + game)
+        state = BoardState(size)
+        tt = TranspositionTable()
+        for ply in range(plies):
+            if state.is_terminal():
+                break
+            key, t = state.canonical_hash()
+            if key not in entries:
+                if ply == 0:
+                    move, value = (size // 2, size // 2), 0.0
+                else:
+                    is_max_state = -state.color == piece.BLACK
+                    move, value, _ = get_best_move(state, depth, is_max_state, difficulty, tt,
+                                                   time_budget, threat_budget=1000,
+                                                   opening=False)
+                    move = tuple(map(int, move))
+                entries[key] = (transform(size, move, t), value)
+                if log is not None:
+                    print(f"game {game} ply {ply}: {move} {value}", file=log)
+            canonical_move, _ = entries[key]
+            move = transform(size, canonical_move, inverse_transform(t))
+
+            candidates = state.legal_moves()
+            if ply > 0 and candidates and rng.random() < explore:
+                move = rng.choice(candidates)
+            state = state.next(move)
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build Gomoku opening books")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[15])
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--plies', type=int, default=8)
+    parser.add_argument('--depth', type=int, default=6)
+    parser.add_argument('--difficulty', default="Hard", choices=["Medium", "Hard"])
+    parser.add_argument('--time-budget', type=float, default=2.0)
+    parser.add_argument('--explore', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--directory', default=BOOK_DIR)
+    parser.add_argument('--extend', action='store_true', help="keep the entries of an existing book")
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        path = book_path(size, args.directory)
+        entries = {}
+        if args.extend and os.path.exists(path):
+            book = OpeningBook(path)
+            for key, move, value in book.records.tolist():
+                entries[key] = ((move // size, move % size), value)
+            book.close()
+        build_book(size, args.games, args.plies, args.depth, args.difficulty,
+                   args.time_budget, args.explore, args.seed, entries, sys.stderr)
+        write_book(path, size, entries)
+        print(f"{path}: {len(entries)} positions", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,23 +1,136 @@
 import numpy as np
 import piece
+from functools import lru_cache
+from itertools import product
+from lines import line_indices, cell_lines, line_matrix
+
+# Marks the padding after a line; scores like a board edge.
+WALL = 2
+
+# evaluate_line consumes lines LINE_CHUNK cells at a time through line_table.
+LINE_CHUNK = 4
+# Scan state of one color: consec (capped at 5, past which calc no longer
+# changes), block_count (1 or 2) and the empty-space flag packed in an int.
+LINE_START = 2
+# Boards evaluate_boards puts through score_lines in one pass.
+BATCH_SIZE = 256
 
 
 def evaluation_state(state, current_color, difficulty="Medium"):
+    return scale(evaluate_color(state, piece.BLACK, current_color),
+                 evaluate_color(state, piece.WHITE, current_color), difficulty)
+
+
+def scale(black, white, difficulty="Medium"):
+    # The evaluation from black's and white's scores (numbers, or arrays
+    # with one entry per position): Easy damps them and adds noise, Hard
+    # weighs them up. Every evaluator goes through here so that their
+    # values stay identical.
     if difficulty == "Easy":
-        basic_eval = evaluate_color(state, piece.BLACK, current_color) * 0.2 + \
-                    evaluate_color(state, piece.WHITE, current_color) * 0.2
-        
-        random_factor = np.random.random() * 100 - 50  
+        basic_eval = black * 0.2 + white * 0.2
+        random_factor = np.random.random(None if np.ndim(black) == 0 else len(black)) * 100 - 50
         return basic_eval + random_factor
-    
+
     if difficulty == "Medium":
-        return evaluate_color(state, piece.BLACK, current_color) + \
-               evaluate_color(state, piece.WHITE, current_color)
-    else:  
-        return (evaluate_color(state, piece.BLACK, current_color) + \
-                evaluate_color(state, piece.WHITE, current_color)) * 1.3
-    
+        return black + white
+    else:
+        return (black + white) * 1.3
+
+class IncrementalEvaluator:
+    # Keeps the evaluate_line scores of every line so that a move only
+    # re-scores the (at most) 4 lines through the new stone.
+    def __init__(self, state):
+        self.size = state.size
+        self.cells = np.asarray(state.values).flatten().tolist()
+        self.lines = line_indices(self.size)
+        self.cell_lines = cell_lines(self.size)
+        self.scores = [self.score_line(line_id)
+                       for line_id in range(len(self.lines))]
+        self.black_current = sum(s[0] for s in self.scores)
+        self.black_other = sum(s[1] for s in self.scores)
+        self.white_current = sum(s[2] for s in self.scores)
+        self.white_other = sum(s[3] for s in self.scores)
+        self.history = []
+
+    def score_line(self, line_id):
+        cells = self.cells
+        line = [cells[k] for k in self.lines[line_id]]
+        return evaluate_line_scores(line)
+
+    def move(self, position, color):
+        i, j = position
+        k = int(i) * self.size + int(j)
+        self.cells[k] = color
+        changed = []
+        for line_id in self.cell_lines[k]:
+            old = self.scores[line_id]
+            new = self.score_line(line_id)
+            self.scores[line_id] = new
+            self.add(new, old)
+            changed.append((line_id, old))
+        self.history.append((k, changed))
+
+    def undo(self):
+        k, changed = self.history.pop()
+        self.cells[k] = piece.EMPTY
+        for line_id, old in changed:
+            self.add(old, self.scores[line_id])
+            self.scores[line_id] = old
+
+    def score_moves(self, moves, color, current_color, difficulty="Medium"):
+        # evaluate(current_color) after color plays each of moves, for all
+        # moves at once: only the lines through each move change, and they
+        # are re-scored together by score_lines.
+        size = self.size
+        pair_move = []
+        pair_line = []
+        pair_cell = []
+        for index, (i, j) in enumerate(moves):
+            k = int(i) * size + int(j)
+            for line_id in self.cell_lines[k]:
+                pair_move.append(index)
+                pair_line.append(line_id)
+                pair_cell.append(k)
+
+        matrix, positions = line_matrix(size)
+        cells = np.array(self.cells + [WALL], dtype=np.int8)
+        stack = cells[matrix[pair_line]]
+        stack[np.arange(len(pair_line)), positions[pair_line, pair_cell]] = color
+
+        black_current = current_color == piece.BLACK
+        black_index = 0 if black_current else 1
+        white_index = 3 if black_current else 2
+        delta = score_lines(stack) - np.array(self.scores, dtype=np.int64)[pair_line]
+        black_delta = delta[:, black_index]
+        white_delta = delta[:, white_index]
+
+        n = len(moves)
+        black = np.full(n, self.black_current if black_current else self.black_other, dtype=np.int64)
+        white = np.full(n, self.white_other if black_current else self.white_current, dtype=np.int64)
+        np.add.at(black, pair_move, black_delta)
+        np.add.at(white, pair_move, white_delta)
+        return scale(black, -white, difficulty).tolist()
+
+    def add(self, new, old):
+        self.black_current += new[0] - old[0]
+        self.black_other += new[1] - old[1]
+        self.white_current += new[2] - old[2]
+        self.white_other += new[3] - old[3]
+
+    def evaluate(self, current_color, difficulty="Medium"):
+        # Same arithmetic as evaluation_state, so the scores are identical.
+        if current_color == piece.BLACK:
+            black, white = self.black_current, -self.white_other
+        else:
+            black, white = self.black_other, -self.white_current
+        return scale(black, white, difficulty)
+
+
 def evaluate_color(state, color, current_color):
+    bits = getattr(state, 'bits', None)
+    if bits is not None:
+        return bits.evaluate_color(color, current_color)
+
     values = state.values
     size = state.size
     current = color == current_color
@@ -39,20 +152,125 @@ def evaluate_color(state, color, current_color):
 
 
 def evaluate_line(line, color, current):
-    evaluation = 0
+    index = (0 if color == piece.BLACK else 2) + (0 if current else 1)
+    return evaluate_line_scores(line)[index]
+
+
+def evaluate_line_scores(line):
+    # (black current, black other, white current, white other) scores of a
+    # line. The line is padded with WALL, which scores like its end, so the
+    # last runs are flushed and every chunk has its lookahead cell.
+    if isinstance(line, np.ndarray):
+        line = line.tolist()
     size = len(line)
-    consec = 0
-    block_count = 2 
-    empty = False
+    chunks = size // LINE_CHUNK + 1
+    line = tuple(line) + (WALL,) * (chunks * LINE_CHUNK + 1 - size)
+
+    table = line_table()
+    black_current = black_other = white_current = white_other = 0
+    state = 0
+    for i in range(0, chunks * LINE_CHUNK, LINE_CHUNK):
+        bc, bo, wc, wo, state = table[state][line[i:i + LINE_CHUNK + 1]]
+        black_current += bc
+        black_other += bo
+        white_current += wc
+        white_other += wo
+
+    return black_current, black_other, white_current, white_other
+
+
+@lru_cache(maxsize=None)
+def line_table():
+    # Row s maps LINE_CHUNK cells plus one cell of lookahead to the four
+    # scores flushed while scanning them from the joint black/white scan
+    # state s, and the row of the state after. Rows are numbered as they
+    # are reached from the start of a line; WALL only appears as a suffix.
+    windows = [window + (WALL,) * (LINE_CHUNK + 1 - n)
+               for n in range(LINE_CHUNK + 2)
+               for window in product((piece.EMPTY, piece.BLACK, piece.WHITE), repeat=n)]
+    scans = {}
+
+    def scan(state, window, color):
+        key = (state, window, color)
+        if key not in scans:
+            current, next_state = scan_chunk(state, window, color, True)
+            other, _ = scan_chunk(state, window, color, False)
+            scans[key] = (current, other, next_state)
+        return scans[key]
+
+    states = [(LINE_START, LINE_START)]
+    rows = {states[0]: 0}
+    table = []
+    while len(table) < len(states):
+        black, white = states[len(table)]
+        row = {}
+        for window in windows:
+            bc, bo, next_black = scan(black, window, piece.BLACK)
+            wc, wo, next_white = scan(white, window, piece.WHITE)
+            next_state = (next_black, next_white)
+            if next_state not in rows:
+                rows[next_state] = len(states)
+                states.append(next_state)
+            row[window] = (bc, bo, wc, wo, rows[next_state])
+        table.append(row)
+    return table
+
+
+@lru_cache(maxsize=None)
+def line_arrays():
+    # line_table as flat arrays indexed by state * 4 ** (LINE_CHUNK + 1) +
+    # window code, where cell t of the window adds (value + 1) * 4 ** t:
+    # the four scores per entry, and the next state.
+    table = line_table()
+    codes = 4 ** (LINE_CHUNK + 1)
+    scores = np.zeros((len(table) * codes, 4), dtype=np.int64)
+    states = np.zeros(len(table) * codes, dtype=np.intp)
+    for row, entries in enumerate(table):
+        for window, (bc, bo, wc, wo, next_state) in entries.items():
+            index = row * codes + sum((value + 1) * 4 ** t for t, value in enumerate(window))
+            scores[index] = (bc, bo, wc, wo)
+            states[index] = next_state
+    return scores, states
+
 
-    for i in range(len(line)):
-        value = line[i]
+def score_lines(lines):
+    # evaluate_line_scores for every row of an (n, length) int array at
+    # once, as an (n, 4) array. Rows are padded with WALL as in
+    # evaluate_line_scores, and each step of the scan is one table lookup
+    # for a chunk of every row.
+    lines = np.asarray(lines)
+    n, length = lines.shape
+    chunks = -(-length // LINE_CHUNK)
+    digits = np.full((n, chunks * LINE_CHUNK + 1), WALL + 1, dtype=np.intp)
+    digits[:, :length] = lines
+    digits[:, :length] += 1
+    codes = np.zeros((n, chunks), dtype=np.intp)
+    for t in range(LINE_CHUNK + 1):
+        codes += digits[:, t:t + chunks * LINE_CHUNK:LINE_CHUNK] << (2 * t)
+
+    scores, states = line_arrays()
+    width = 4 ** (LINE_CHUNK + 1)
+    total = np.zeros((n, 4), dtype=np.int64)
+    state = np.zeros(n, dtype=np.intp)
+    for c in range(chunks):
+        index = state * width + codes[:, c]
+        total += scores[index]
+        state = states[index]
+    return total
+
+
+def scan_chunk(state, window, color, current):
+    consec, block_count, empty = state // 4, state // 2 % 2 + 1, bool(state % 2)
+    evaluation = 0
+
+    for i in range(LINE_CHUNK):
+        value = window[i]
 
         if value == color:
-            consec += 1
+            consec = min(consec + 1, 5)
 
         elif value == piece.EMPTY and consec > 0:
-            if not empty and i < size - 1 and line[i + 1] == color:
+            if not empty and window[i + 1] == color:
                 empty = True
             else:
                 evaluation += calc(consec, block_count - 1, current, empty)
@@ -71,11 +289,38 @@ def evaluate_line(line, color, current):
         else:
             block_count = 2
 
-    if consec > 0:
-        evaluation += calc(consec, block_count, current)
+    return evaluation, consec * 4 + (block_count - 1) * 2 + empty
+
 
-    return evaluation
+def evaluate_boards(boards, current_color, difficulty="Medium"):
+    # evaluation_state for every board of an (n, size, size) stack, with
+    # current_color one color for all of them or one per board. All lines
+    # of BATCH_SIZE boards are scored together by score_lines.
+    boards = np.asarray(boards, dtype=np.int8)
+    n, size = len(boards), boards.shape[1]
+    black_current = np.broadcast_to(np.asarray(current_color), (n,)) == piece.BLACK
+    matrix, _ = line_matrix(size)
+    scores = np.zeros((n, 4), dtype=np.int64)
 
+    for start in range(0, n, BATCH_SIZE):
+        chunk = boards[start:start + BATCH_SIZE].reshape(-1, size * size)
+        m = len(chunk)
+        cells = np.concatenate([chunk, np.full((m, 1), WALL, dtype=np.int8)], axis=1)
+        lines = cells[:, matrix].reshape(-1, size + 1)
+        scores[start:start + m] = score_lines(lines).reshape(m, -1, 4).sum(axis=1)
+
+    black = np.where(black_current, scores[:, 0], scores[:, 1])
+    white = -np.where(black_current, scores[:, 3], scores[:, 2])
+    return scale(black, white, difficulty)
+
+
+def evaluate_children(state, moves, difficulty="Medium"):
+    # evaluation_state after the side to move in state plays each of moves,
+    # as one evaluate_boards batch.
+    boards = np.repeat(state.values[None], len(moves), axis=0)
+    rows, columns = zip(*moves)
+    boards[np.arange(len(moves)), rows, columns] = -state.color
+    return evaluate_boards(boards, state.color, difficulty).tolist()
 
 
 def calc(consec, block_count, is_current, has_empty_space=False):
@@ -109,3 +354,8 @@ def calc(consec, block_count, is_current, has_empty_space=False):
         value *= empty_space_score[consec_idx]
 
     return int(value)
+
+
+# Built at import rather than inside the first timed search; forked worker
+# processes inherit the tables.
+line_arrays()
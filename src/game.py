@@ -1,12 +1,48 @@
+import json
+import logging
 import piece
-import numpy as np
+import profiling
 from board import BoardState
-from ai import get_best_move
+from ai import get_best_move, static_move
+from transposition import EvalCache, TranspositionTable
+from parallel import RootSearchPool
+from book import load_book
+from ponder import Ponderer
+
+# One JSON record per AI move; attach a handler to collect them.
+log = logging.getLogger("gomoku.search")
 
 class GameRunner:
-    def __init__(self, size=19, difficulty="Medium"):
+    def __init__(self, size=19, difficulty="Medium", tt_size=1 << 18, tt_policy="depth",
+                 radius=1, backend="numpy", time_budget=None, max_depth=20, workers=1,
+                 threat_budget=1000, algorithm="pvs", book=False,
+                 tt_symmetry=False, ponder=False, timers=False, profile=None, lmr=False,
+                 widths=None, frontier=False, eval_cache_size=1 << 24):
         self.size = size
         self.difficulty = difficulty
+        self.tt_size = tt_size
+        self.tt_policy = tt_policy
+        self.tt_symmetry = tt_symmetry
+        # Leaf values stay valid across moves and games, so unlike the
+        # transposition table the cache survives restart().
+        self.eval_cache_size = eval_cache_size
+        self.eval_cache = EvalCache(eval_cache_size) if eval_cache_size else None
+        self.radius = radius
+        self.backend = backend
+        self.time_budget = time_budget
+        self.threat_budget = threat_budget
+        self.algorithm = algorithm
+        self.lmr = lmr
+        self.widths = widths
+        self.frontier = frontier
+        # The shipped books are shallow seed books, so playing from them is
+        # opt-in.
+        self.book = load_book(size) if book else None
+        self.pool = (RootSearchPool(workers, tt_size, tt_policy, tt_symmetry)
+                     if workers > 1 else None)
+        self.ponderer = Ponderer() if ponder else None
+        self.timers = timers
+        self.set_profile(profile)
         self.finished = False
         
         if difficulty == "Easy":
@@ -15,14 +51,22 @@ class GameRunner:
             self.depth = 2
         else:  
             self.depth = 3
+        if time_budget is not None and difficulty != "Easy":
+            self.depth = max_depth
             
         self.restart()
 
 
     def restart(self, player_index=-1):
+        if self.ponderer is not None:
+            self.ponderer.stop()
         self.is_max_state = True if player_index == -1 else False 
-        self.state = BoardState(self.size) 
+        self.state = BoardState(self.size, radius=self.radius, backend=self.backend) 
         self.ai_color = -player_index
+        self.last_search = {}
+        self.tt = None
+        if self.tt_size:
+            self.tt = TranspositionTable(self.tt_size, self.tt_policy, self.tt_symmetry)
 
     def play(self, i, j):
         position = (i, j) 
@@ -30,6 +74,8 @@ class GameRunner:
             return False
         if not self.state.is_valid_position(position): 
             return False
+        if self.ponderer is not None:
+            self.ponderer.stop()
         self.state = self.state.next(position)
         self.finished = self.state.is_terminal() 
         return True
@@ -37,39 +83,115 @@ class GameRunner:
     def aiplay(self): 
         if self.state.color == self.ai_color:
             return 0.0
+
+        if self.ponderer is not None:
+            self.ponderer.stop()
+            hit = self.ponderer.take(self.state)
+            if hit is not None:
+                move, value, _, info = hit
+                self.last_search = dict(info, ponder=True)
+                move_time = self.ai_move(move, 0.0)
+                self.start_ponder()
+                return move_time
         
         try:
-            move, value, move_time = get_best_move(self.state, self.depth, self.is_max_state, self.difficulty) 
-            
-            if not isinstance(move, tuple):
-                move = tuple(map(int, move))
-            
-            if not isinstance(move, tuple) or len(move) != 2 or not self.state.is_valid_position(move):
-                legal_moves = self.state.legal_moves()
-                if len(legal_moves) > 0:
-                    move = legal_moves[np.random.choice(len(legal_moves))]
-                else:
-                    return 0.0
-            
-            self.state = self.state.next(move)
-            self.finished = self.state.is_terminal()
-            return move_time
+            self.last_search = {}
+            (move, value, move_time), report = profiling.run(
+                self.profile, get_best_move, self.state, self.depth, self.is_max_state, self.difficulty,
+                self.tt, self.time_budget, self.last_search, self.pool, self.threat_budget,
+                self.algorithm, self.book, timers=self.timers, lmr=self.lmr, widths=self.widths,
+                frontier=self.frontier, eval_cache=self.eval_cache)
+            if report is not None:
+                self.last_search['profile'] = report
+            move_time = self.ai_move(move, move_time)
         except Exception as e:
             print(f"Error in AI move: {e}")
-            
-            legal_moves = self.state.legal_moves()
-            if len(legal_moves) > 0:
-                move = legal_moves[np.random.choice(len(legal_moves))]
-                self.state = self.state.next(move)
-                self.finished = self.state.is_terminal()
+            move_time = self.ai_move(None, 0.0)
+        self.start_ponder()
+        return move_time
+
+    def start_ponder(self):
+        # Searches answers to the opponent's likely replies until play()
+        # or aiplay() stops it; a hit makes the next aiplay instant.
+        if self.ponderer is not None and not self.finished:
+            self.ponderer.start(self.state, self.search_options(), self.tt, self.book,
+                                self.eval_cache)
+
+    def ai_move(self, move, move_time):
+        # Plays a move found for the AI (possibly by another process); an
+        # invalid or missing move falls back to the statically best one.
+        self.last_search['move_time'] = move_time
+        if move is not None and not isinstance(move, tuple):
+            move = tuple(map(int, move))
+
+        if move is None or len(move) != 2 or not self.state.is_valid_position(move):
+            if len(self.state.legal_moves()) == 0:
                 return 0.0
-            return 0.0
+            move = static_move(self.state, self.is_max_state, self.difficulty)
+
+        self.state = self.state.next(move)
+        self.finished = self.state.is_terminal()
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps(self.search_record(move)))
+        return move_time
+
+    def search_record(self, move):
+        record = {
+            'event': "ai_move",
+            'size': self.size,
+            'difficulty': self.difficulty,
+            'move': [int(move[0]), int(move[1])],
+        }
+        record.update(self.last_search)
+        record.pop('forced', None)
+        return record
+
+    def set_profile(self, mode):
+        # Profiles every following AI search with cProfile or the sampling
+        # profiler (see profiling.PROFILE_MODES); None switches it off.
+        if mode not in profiling.PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.profile = mode
+
+    def search_options(self):
+        # Everything besides the position that get_best_move needs, for
+        # running the AI's search elsewhere.
+        return {
+            'depth': self.depth,
+            'is_max_state': self.is_max_state,
+            'difficulty': self.difficulty,
+            'time_budget': self.time_budget,
+            'threat_budget': self.threat_budget,
+            'algorithm': self.algorithm,
+            'lmr': self.lmr,
+            'widths': self.widths,
+            'frontier': self.frontier,
+            'tt_size': self.tt_size,
+            'tt_policy': self.tt_policy,
+            'tt_symmetry': self.tt_symmetry,
+            'eval_cache_size': self.eval_cache_size,
+            'timers': self.timers,
+            'profile': self.profile,
+        }
     
+    def close(self):
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+
     def get_status(self):
-        board = self.state.values
         return {
-            'board': board.tolist(), 
-            'next': -self.state.color, 
-            'finished': self.finished, 
-            'winner': self.state.winner, 
+            'board': self.state.cells(), 
+            'next': int(-self.state.color), 
+            'finished': bool(self.finished), 
+            'winner': int(self.state.winner), 
+            'depth': self.last_search.get('depth', 0),
+            'move_time': self.last_search.get('move_time', 0.0),
+            'stats': self.last_search.get('stats', {}),
+            'profile': self.last_search.get('profile'),
         }
@@ -0,0 +1,63 @@
+import numpy as np
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def line_indices(size):
+    # Flat cell indices of every line BoardState.get_lines yields, in order.
+    cells = np.arange(size * size).reshape(size, size)
+    lines = []
+
+    for i in range(size):
+        lines.append(tuple(cells[i, :].tolist()))
+        lines.append(tuple(cells[:, i].tolist()))
+
+    for i in range(-size + 5, size - 4):
+        lines.append(tuple(np.diag(cells, k=i).tolist()))
+        lines.append(tuple(np.diag(np.fliplr(cells), k=i).tolist()))
+
+    return tuple(lines)
+
+
+@lru_cache(maxsize=None)
+def cell_lines(size):
+    # For every flat cell index, the ids of the lines passing through it.
+    through = [[] for _ in range(size * size)]
+    for line_id, line in enumerate(line_indices(size)):
+        for k in line:
+            through[k].append(line_id)
+    return tuple(tuple(ids) for ids in through)
+
+
+@lru_cache(maxsize=None)
+def line_matrix(size):
+    # line_indices as a (lines, size + 1) array padded with -1, plus the
+    # position of each flat cell within each line (-1 when not on it).
+    lines = line_indices(size)
+    matrix = np.full((len(lines), size + 1), -1, dtype=np.intp)
+    positions = np.full((len(lines), size * size), -1, dtype=np.intp)
+    for line_id, line in enumerate(lines):
+        matrix[line_id, :len(line)] = line
+        positions[line_id, list(line)] = np.arange(len(line))
+    return matrix, positions
+
+
+@lru_cache(maxsize=None)
+def cell_segments(size):
+    # For every flat cell index, the cells within 4 steps of it along each
+    # of the 4 line directions, as (cells, position of the cell itself).
+    segments = []
+    for k in range(size * size):
+        i, j = divmod(k, size)
+        through = []
+        for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            cells = []
+            for t in range(-4, 5):
+                ni, nj = i + t * di, j + t * dj
+                if 0 <= ni < size and 0 <= nj < size:
+                    if t == 0:
+                        position = len(cells)
+                    cells.append(ni * size + nj)
+            through.append((tuple(cells), position))
+        segments.append(tuple(through))
+    return tuple(segments)
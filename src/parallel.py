@@ -0,0 +1,120 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ai import INFINITY, SearchContext, SearchTimeout, best_of, search_child
+from board import from_snapshot
+from eval_fn import IncrementalEvaluator
+from transposition import TranspositionTable, worker_eval_cache
+
+# Worker-process state, reused by every root move searched from the same
+# root position (including later iterative-deepening iterations).
+_worker = {'search_id': None, 'board': None, 'tt': None}
+
+
+def search_move(snapshot, move, depth, is_max_state, difficulty, alpha, beta, deadline,
+                search_id, tt_size, tt_policy, tt_symmetry, algorithm, max_color, lmr, widths,
+                frontier, eval_cache_size, timers=False):
+    # Searches one root move; returns its value (None when the deadline
+    # passed) and the search's stats() for the parent to merge.
+    if _worker['search_id'] != search_id:
+        state = from_snapshot(snapshot)
+        _worker['search_id'] = search_id
+        _worker['board'] = state.search_board(IncrementalEvaluator(state))
+        _worker['tt'] = (TranspositionTable(tt_size, tt_policy, tt_symmetry)
+                         if tt_size else None)
+    board = _worker['board']
+    # Unlike the table, the evaluation cache outlives the root position.
+    eval_cache = worker_eval_cache(eval_cache_size)
+    tt = _worker['tt']
+    if tt is not None:
+        probes, hits = tt.probes, tt.hits
+    if eval_cache is not None:
+        eval_hits, eval_misses = eval_cache.hits, eval_cache.misses
+
+    ctx = SearchContext(difficulty, tt, deadline, algorithm, max_color, timers=timers,
+                        lmr=lmr, widths=widths, frontier=frontier, eval_cache=eval_cache)
+    try:
+        value = search_child(board, move, depth, alpha, beta, is_max_state, ctx)
+    except SearchTimeout:
+        value = None
+        # The aborted search left moves on the board; rebuild it next time.
+        _worker['search_id'] = None
+    stats = ctx.stats()
+    if tt is not None:
+        stats['tt_probes'] = tt.probes - probes
+        stats['tt_hits'] = tt.hits - hits
+    if eval_cache is not None:
+        stats['eval_hits'] = eval_cache.hits - eval_hits
+        stats['eval_misses'] = eval_cache.misses - eval_misses
+    return value, stats
+
+
+class RootSearchPool:
+    # Spreads the root moves of get_best_move over a persistent process
+    # pool. The first move is searched alone (young brothers wait) to get a
+    # bound; the rest are handed out one per free worker with the best
+    # value known at dispatch time as a lazy alpha (beta when minimizing).
+    def __init__(self, workers=None, tt_size=1 << 16, tt_policy="depth", tt_symmetry=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.tt_size = tt_size
+        self.tt_policy = tt_policy
+        self.tt_symmetry = tt_symmetry
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def search_root(self, board, top_moves, depth, is_max_state, ctx,
+                    alpha=-INFINITY, beta=INFINITY):
+        snapshot = board.snapshot()
+        search_id = (os.getpid(), board.hash, ctx.difficulty, is_max_state, ctx.algorithm)
+        eval_cache_size = ctx.eval_cache.max_bytes if ctx.eval_cache is not None else 0
+        moves = [move for move, _ in top_moves]
+        values = [None] * len(moves)
+        if ctx.algorithm == "minimax":
+            alpha, beta = max(alpha, -10e5), min(beta, 10e5)
+
+        def submit(index, bound):
+            low, high = alpha, beta
+            if bound is not None:
+                if is_max_state:
+                    low = max(low, bound)
+                else:
+                    high = min(high, bound)
+            return self.executor.submit(search_move, snapshot, moves[index], depth,
+                                        is_max_state, ctx.difficulty, low, high,
+                                        ctx.deadline, search_id, self.tt_size,
+                                        self.tt_policy, self.tt_symmetry, ctx.algorithm,
+                                        ctx.max_color, ctx.lmr, ctx.widths, ctx.frontier,
+                                        eval_cache_size, ctx.times is not None)
+
+        def collect(index, future):
+            value, stats = future.result()
+            ctx.merge(stats)
+            if value is None:
+                raise SearchTimeout()
+            values[index] = value
+
+        collect(0, submit(0, None))
+        pending = {}
+        next_index = 1
+        while next_index < len(moves) or pending:
+            while next_index < len(moves) and len(pending) < self.workers:
+                pending[submit(next_index, self.bound(values, is_max_state))] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(pending.pop(future), future)
+
+        # Searching just outside the best known value keeps every move that
+        # ties it exact, so best_of picks the same move as the sequential
+        # search, from the same starting value.
+        limit = 9999 if ctx.algorithm == "minimax" else INFINITY
+        return best_of(list(zip(moves, values)), is_max_state, limit)
+
+    @staticmethod
+    def bound(values, is_max_state):
+        known = [value for value in values if value is not None]
+        if is_max_state:
+            return math.nextafter(max(known), -math.inf)
+        return math.nextafter(min(known), math.inf)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,74 @@
+import threading
+import piece
+from ai import get_best_move, get_top_moves, search_kwargs
+from eval_fn import IncrementalEvaluator
+from threats import forced_blocks
+
+
+def predict_replies(state, count, difficulty="Medium"):
+    # The opponent's most likely replies in state (the AI has just moved):
+    # the blocks of a five the AI threatens, else the statically best moves.
+    if state.is_terminal():
+        return []
+    board = state.search_board(IncrementalEvaluator(state))
+    moves = forced_blocks(state, -state.color) or None
+    if moves is None and not board.legal_moves():
+        return []
+    is_max_state = -state.color == piece.BLACK
+    return [move for move, _ in get_top_moves(board, count, is_max_state, difficulty, moves)]
+
+
+def ponder(state, replies, options, stop, tt=None, book=None, eval_cache=None):
+    # Searches the AI's answer to each reply in turn, yielding
+    # (hash of the position after the reply, (move, value, move_time, info))
+    # for every search that finished before stop was set. options holds
+    # GameRunner.search_options().
+    for reply in replies:
+        if stop.is_set():
+            return
+        child = state.next(reply)
+        if child.is_terminal():
+            continue
+        info = {}
+        move, value, move_time = get_best_move(child, options['depth'], options['is_max_state'],
+                                               options['difficulty'], tt, options['time_budget'],
+                                               info, book=book, stop=stop, eval_cache=eval_cache,
+                                               **search_kwargs(options))
+        # A search cut short by stop returns a move; it is not kept.
+        if stop.is_set():
+            return
+        yield child.hash, (tuple(map(int, move)), value, move_time, info)
+
+
+class Ponderer:
+    # Ponders on a background thread while the opponent thinks. stop()
+    # cancels it within a few dozen nodes and keeps what finished.
+    def __init__(self, replies=3):
+        self.replies = replies
+        self.results = {}
+        self.event = threading.Event()
+        self.thread = None
+
+    def start(self, state, options, tt=None, book=None, eval_cache=None):
+        self.stop()
+        self.results = {}
+        self.event = threading.Event()
+        self.thread = threading.Thread(target=self.run,
+                                       args=(state, options, tt, book, eval_cache, self.event),
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, state, options, tt, book, eval_cache, event):
+        replies = predict_replies(state, self.replies, options['difficulty'])
+        for key, result in ponder(state, replies, options, event, tt, book, eval_cache):
+            self.results[key] = result
+
+    def stop(self):
+        self.event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def take(self, state):
+        # The pondered answer for state, if its reply was searched.
+        return self.results.pop(state.hash, None)
@@ -0,0 +1,92 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+# Profilers GameRunner.set_profile accepts; None turns profiling off.
+PROFILE_MODES = (None, "cprofile", "sample")
+
+
+def run(mode, fn, *args, **kwargs):
+    # Calls fn under the profiler named by mode and returns
+    # (fn's result, report dict), with a None report when mode is None.
+    if mode is None:
+        return fn(*args, **kwargs), None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args, **kwargs)
+        return result, cprofile_report(profiler)
+    if mode == "sample":
+        sampler = Sampler(threading.get_ident())
+        sampler.start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            sampler.stop()
+        return result, sampler.report()
+    raise ValueError(f"Unknown profile mode: {mode}")
+
+
+def function_name(filename, line, name):
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def cprofile_report(profiler, limit=20):
+    # The limit functions with the most cumulative time.
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items():
+        rows.append({'function': function_name(filename, line, name), 'calls': calls,
+                     'self': own, 'cumulative': cumulative})
+    rows.sort(key=lambda row: row['cumulative'], reverse=True)
+    return {'mode': "cprofile", 'functions': rows[:limit]}
+
+
+class Sampler:
+    # Samples one thread's stack from a background thread every interval
+    # seconds. Much cheaper than cProfile for long searches, at the price
+    # of statistical rather than exact numbers.
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()
+        self.total = Counter()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                name = function_name(code.co_filename, code.co_firstlineno, code.co_name)
+                if top:
+                    self.own[name] += 1
+                    top = False
+                if name not in seen:
+                    seen.add(name)
+                    self.total[name] += 1
+                frame = frame.f_back
+
+    def report(self, limit=20):
+        # Share of samples each function was running (self) or on the
+        # stack (total) in, for the limit most frequently seen functions.
+        samples = self.samples or 1
+        rows = [{'function': name, 'self': self.own[name] / samples, 'total': count / samples}
+                for name, count in self.total.most_common(limit)]
+        return {'mode': "sample", 'samples': self.samples, 'interval': self.interval,
+                'functions': rows}
@@ -0,0 +1,477 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from ai import get_best_move, search_kwargs
+from board import from_snapshot
+import profiling
+from book import load_book
+from game import GameRunner
+from ponder import ponder, predict_replies
+from transposition import options_table, worker_eval_cache
+
+# Extra time a search gets past its game's budget before the service stops
+# waiting for it and plays a fallback move instead.
+GRACE = 1.0
+# Transposition tables a worker keeps, one per recently searched game.
+WORKER_TABLES = 32
+# Searches and ponder jobs that can run at once; each owns a slot of the
+# shared stop flags.
+STOP_SLOTS = 256
+# Searches that can report live progress at once; each owns a (depth, nodes)
+# pair of the shared progress counters.
+PROGRESS_SLOTS = 256
+# GameRunner settings a "new" request may set besides size, difficulty,
+# player and book.
+RUNNER_OPTIONS = ('time_budget', 'max_depth', 'threat_budget', 'algorithm', 'tt_size',
+                  'tt_policy', 'tt_symmetry', 'radius', 'backend', 'timers', 'profile',
+                  'lmr', 'widths', 'frontier', 'eval_cache_size')
+
+# Worker-process state.
+_books = {}
+_tables = OrderedDict()
+_flags = None
+_progress = None
+
+
+def init_worker(flags, progress):
+    global _flags, _progress
+    _flags = flags
+    _progress = progress
+
+
+class StopFlag:
+    # Worker-side view of one slot of the service's shared stop flags.
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return _flags[self.slot] != 0
+
+
+class Progress:
+    # Worker-side writer of one slot of the service's progress counters.
+    def __init__(self, slot):
+        self.slot = slot
+
+    def report(self, depth, nodes):
+        _progress[2 * self.slot] = depth
+        _progress[2 * self.slot + 1] = nodes
+
+
+def worker_table(table_id, options):
+    if not options['tt_size']:
+        return None
+    tt = _tables.pop(table_id, None)
+    if tt is None:
+        tt = options_table(options)
+    _tables[table_id] = tt
+    while len(_tables) > WORKER_TABLES:
+        _tables.popitem(last=False)
+    return tt
+
+
+def worker_book(size, options):
+    if not options['book']:
+        return None
+    if size not in _books:
+        _books[size] = load_book(size)
+    return _books[size]
+
+
+def think(table_id, snapshot, options, submitted, slot=None, stop_slot=None):
+    # get_best_move for one session, run in a worker process. Time spent
+    # queued for a free worker counts against the game's time budget.
+    # With a slot, the search reports its progress there; with a stop_slot,
+    # it gives up (keeping its best move so far) once that flag is set.
+    state = from_snapshot(snapshot)
+    time_budget = options['time_budget']
+    if time_budget is not None:
+        time_budget = max(0.0, time_budget - (time.time() - submitted))
+
+    info = {}
+    (move, value, move_time), report = profiling.run(
+        options['profile'], get_best_move, state, options['depth'], options['is_max_state'],
+        options['difficulty'], worker_table(table_id, options), time_budget, info,
+        book=worker_book(state.size, options), progress=None if slot is None else Progress(slot),
+        eval_cache=worker_eval_cache(options['eval_cache_size']),
+        stop=None if stop_slot is None else StopFlag(stop_slot), **search_kwargs(options))
+    if report is not None:
+        info['profile'] = report
+    return tuple(map(int, move)), value, move_time, info
+
+
+def ponder_job(table_id, snapshot, options, replies, slot):
+    # Ponders a session's position in a worker process until its stop flag
+    # is set; returns the finished answers keyed by position hash.
+    state = from_snapshot(snapshot)
+    stop = StopFlag(slot)
+    replies = predict_replies(state, replies, options['difficulty'])
+    return dict(ponder(state, replies, options, stop, worker_table(table_id, options),
+                       worker_book(state.size, options),
+                       worker_eval_cache(options['eval_cache_size'])))
+
+
+class Session:
+    def __init__(self, game_id, runner, book, tt_size, ponder):
+        self.id = game_id
+        self.runner = runner
+        self.book = book
+        self.tt_size = tt_size
+        # Number of opponent replies to ponder after each AI move.
+        self.ponder = ponder
+        # Bumped on restart so workers start a fresh table for the new game.
+        self.epoch = 0
+        self.task = None
+        self.ponder_future = None
+        self.ponder_slot = None
+        self.progress_slot = None
+        self.stop_slot = None
+
+    def thinking(self):
+        return self.task is not None and not self.task.done()
+
+
+class EngineService:
+    # Hosts many GameRunner sessions on one asyncio loop. AI moves are
+    # searched in a process pool, one search in flight per session, so no
+    # game blocks another or the loop. Requests and responses are dicts
+    # (see handle) and are served as JSON lines by serve().
+    def __init__(self, workers=None, time_budget=1.0, tt_size=1 << 16):
+        self.flags = multiprocessing.RawArray('b', STOP_SLOTS)
+        self.free_slots = list(range(STOP_SLOTS))
+        self.progress = multiprocessing.RawArray('q', 2 * PROGRESS_SLOTS)
+        self.free_progress = list(range(PROGRESS_SLOTS))
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                            initargs=(self.flags, self.progress))
+        self.time_budget = time_budget
+        self.tt_size = tt_size
+        self.sessions = {}
+        self.ids = itertools.count(1)
+
+    def session(self, game_id):
+        session = self.sessions.get(game_id)
+        if session is None:
+            raise ValueError(f"Unknown game: {game_id}")
+        return session
+
+    def new_game(self, size=15, difficulty="Medium", player=1, book=False, ponder=0, **options):
+        unknown = set(options) - set(RUNNER_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown game options: {', '.join(sorted(unknown))}")
+        options.setdefault('time_budget', self.time_budget)
+        tt_size = options.pop('tt_size', self.tt_size)
+        # The worker processes own the books and transposition tables.
+        runner = GameRunner(size, difficulty, tt_size=0, book=False, **options)
+        runner.restart(player_index=player)
+
+        session = Session(next(self.ids), runner, book, tt_size, int(ponder))
+        self.sessions[session.id] = session
+        self.think(session.id)
+        return session.id
+
+    def status(self, game_id):
+        session = self.session(game_id)
+        status = session.runner.get_status()
+        status['game'] = game_id
+        status['ai_color'] = session.runner.ai_color
+        status['thinking'] = session.thinking()
+        status['pondering'] = session.ponder_future is not None
+        slot = session.progress_slot
+        if session.thinking() and slot is not None:
+            status['progress'] = {'depth': self.progress[2 * slot],
+                                  'nodes': self.progress[2 * slot + 1]}
+        return status
+
+    def play(self, game_id, i, j):
+        session = self.session(game_id)
+        if session.thinking():
+            raise ValueError("The AI is still thinking")
+        if session.runner.finished or not session.runner.play(i, j):
+            raise ValueError(f"Illegal move: {(i, j)}")
+        self.think(game_id)
+
+    def think(self, game_id):
+        # Starts the AI's search if it is the AI's turn and none is running.
+        session = self.session(game_id)
+        runner = session.runner
+        if (session.thinking() or runner.finished or runner.state.is_full()
+                or runner.state.color == runner.ai_color):
+            return
+        session.task = asyncio.get_running_loop().create_task(self.search(session))
+
+    def options(self, session):
+        options = session.runner.search_options()
+        options['book'] = session.book
+        options['tt_size'] = session.tt_size
+        return options
+
+    async def search(self, session):
+        runner = session.runner
+        pondered = self.stop_ponder(session)
+        if pondered is not None:
+            try:
+                results = await pondered
+            except Exception:
+                results = {}
+            hit = results.get(runner.state.hash)
+            if hit is not None:
+                move, value, _, info = hit
+                runner.last_search = dict(info, ponder=True)
+                runner.ai_move(move, 0.0)
+                self.start_ponder(session)
+                return
+
+        options = self.options(session)
+        slot = self.start_progress(session)
+        stop_slot = self.claim_stop_slot()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, think, (session.id, session.epoch),
+                                      runner.state.snapshot(), options, time.time(), slot,
+                                      stop_slot)
+        if stop_slot is not None:
+            # The worker owns the slot until its job returns, which may be
+            # after this task has given up on it.
+            future.add_done_callback(lambda _: self.free_slots.append(stop_slot))
+        session.stop_slot = stop_slot
+        timeout = None if runner.time_budget is None else runner.time_budget + GRACE
+        try:
+            move, value, move_time, info = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.stop_search(session)
+            move, move_time, info = None, timeout, {}
+        except asyncio.CancelledError:
+            self.stop_search(session)
+            raise
+        except Exception as e:
+            print(f"Error in AI move for game {session.id}: {e}", file=sys.stderr)
+            move, move_time, info = None, 0.0, {}
+        finally:
+            self.stop_progress(session)
+            session.stop_slot = None
+        runner.last_search = info
+        runner.ai_move(move, move_time)
+        self.start_ponder(session)
+
+    def start_progress(self, session):
+        # A cleared progress slot for the session's search, or None when
+        # every slot is busy (the search then runs without reporting).
+        if not self.free_progress:
+            return None
+        slot = self.free_progress.pop()
+        self.progress[2 * slot] = self.progress[2 * slot + 1] = 0
+        session.progress_slot = slot
+        return slot
+
+    def stop_progress(self, session):
+        # Progress is advisory: a cancelled or timed-out search may go on
+        # writing to the slot for a moment after it is reused.
+        if session.progress_slot is not None:
+            self.free_progress.append(session.progress_slot)
+            session.progress_slot = None
+
+    def claim_stop_slot(self):
+        # A cleared stop flag, or None when every slot is busy (the job then
+        # runs until it finishes on its own).
+        if not self.free_slots:
+            return None
+        slot = self.free_slots.pop()
+        self.flags[slot] = 0
+        return slot
+
+    def stop_search(self, session):
+        # Tells the worker running the session's search to give up; the
+        # service has stopped waiting for it.
+        if session.stop_slot is not None:
+            self.flags[session.stop_slot] = 1
+            session.stop_slot = None
+
+    def start_ponder(self, session):
+        # After an AI move, search the opponent's likely replies in a worker
+        # until the real reply arrives (or every slot is busy).
+        runner = session.runner
+        if not session.ponder or runner.finished:
+            return
+        slot = self.claim_stop_slot()
+        if slot is None:
+            return
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, ponder_job, (session.id, session.epoch), runner.state.snapshot(),
+            self.options(session), session.ponder, slot)
+        future.add_done_callback(lambda _: self.free_slots.append(slot))
+        session.ponder_future = future
+        session.ponder_slot = slot
+
+    def stop_ponder(self, session):
+        # Tells the session's ponder job to stop; returns its future, which
+        # resolves to what it finished.
+        future = session.ponder_future
+        if future is not None:
+            self.flags[session.ponder_slot] = 1
+            session.ponder_future = None
+        return future
+
+    async def wait(self, game_id, timeout=None):
+        # Until the AI has moved (or timeout seconds pass).
+        session = self.session(game_id)
+        if session.thinking():
+            await asyncio.wait({session.task}, timeout=timeout)
+
+    def cancel(self, game_id):
+        # Drops the running search; the AI stays on move until think(). The
+        # worker is told to stop now rather than when the task next runs.
+        session = self.session(game_id)
+        self.stop_search(session)
+        if session.thinking():
+            session.task.cancel()
+        session.task = None
+
+    def restart(self, game_id, player=1):
+        session = self.session(game_id)
+        self.cancel(game_id)
+        self.stop_ponder(session)
+        session.runner.restart(player_index=player)
+        session.epoch += 1
+        self.think(game_id)
+
+    def close_game(self, game_id):
+        self.stop_ponder(self.session(game_id))
+        self.cancel(game_id)
+        del self.sessions[game_id]
+
+    async def handle(self, request):
+        # {"op": "new", ...game options} starts a game ("ponder": n ponders
+        # n likely replies after each AI move); "status", "play"
+        # (with i, j), "wait" (optional timeout), "think", "cancel",
+        # "restart" (optional player), "profile" (mode, see profiling) and
+        # "close" take a "game" id. Every
+        # response echoes the request's "id" and reports "ok"; while the AI
+        # is thinking, its status has the search's "progress" (depth, nodes).
+        op = request.get('op')
+        response = {'id': request.get('id')}
+        try:
+            if op == 'new':
+                options = {k: v for k, v in request.items() if k not in ('id', 'op')}
+                game_id = self.new_game(**options)
+            else:
+                game_id = request.get('game')
+                if op == 'play':
+                    self.play(game_id, int(request['i']), int(request['j']))
+                elif op == 'wait':
+                    await self.wait(game_id, request.get('timeout'))
+                elif op == 'think':
+                    self.think(game_id)
+                elif op == 'cancel':
+                    self.cancel(game_id)
+                elif op == 'restart':
+                    self.restart(game_id, request.get('player', 1))
+                elif op == 'profile':
+                    self.session(game_id).runner.set_profile(request.get('mode'))
+                elif op == 'close':
+                    self.close_game(game_id)
+                    response['ok'] = True
+                    return response
+                elif op != 'status':
+                    raise ValueError(f"Unknown op: {op}")
+            response['status'] = self.status(game_id)
+            response['ok'] = True
+        except (KeyError, TypeError, ValueError) as e:
+            response['ok'] = False
+            response['error'] = str(e)
+        return response
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def connection(self, reader, writer):
+        # One JSON request per line. Requests are handled concurrently, so a
+        # "wait" does not hold up the rest of the connection; match
+        # responses to requests by "id".
+        tasks = set()
+
+        async def respond(request):
+            response = await self.handle(request)
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                request = {'op': None, 'error': str(e)}
+            task = asyncio.create_task(respond(request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    def shutdown(self):
+        # Stops every worker job without waiting for it: each one returns
+        # within a few nodes of seeing its flag.
+        for slot in range(STOP_SLOTS):
+            self.flags[slot] = 1
+        tasks = [session.task for session in self.sessions.values() if session.thinking()]
+        for game_id in list(self.sessions):
+            self.close_game(game_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return tasks
+
+    async def close(self):
+        # shutdown(), then lets the cancelled searches unwind.
+        tasks = self.shutdown()
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+class EngineThread:
+    # An EngineService on its own event loop thread, for clients with a
+    # main loop of their own (the Tk GUI). request() takes the same dicts
+    # as the JSON interface and returns a concurrent.futures.Future.
+    def __init__(self, **options):
+        self.service = EngineService(**options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, request):
+        return asyncio.run_coroutine_threadsafe(self.service.handle(request), self.loop)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.service.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gomoku engine service (JSON lines over TCP)")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--time-budget', type=float, default=1.0)
+    parser.add_argument('--tt-size', type=int, default=1 << 16)
+    args = parser.parse_args(argv)
+
+    service = EngineService(args.workers, args.time_budget, args.tt_size)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
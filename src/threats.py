@@ -0,0 +1,204 @@
+import piece
+from itertools import combinations
+from bitboard import BitBoard, match
+from lines import cell_segments
+
+WIN_SCORE = 100000
+
+
+def gap_patterns(length, stones, fixed_ends=False):
+    # Every window of the given length with `stones` own stones and the
+    # rest empty, with the offsets of its empty cells. With fixed_ends the
+    # two end cells are always empty and only the middle varies.
+    inner = range(1, length - 1) if fixed_ends else range(length)
+    patterns = []
+    for owned in combinations(inner, stones):
+        pattern = ''.join('x' if t in owned else '_' for t in range(length))
+        gaps = tuple(t for t in inner if t not in owned)
+        patterns.append((pattern, gaps))
+    return tuple(patterns)
+
+
+# Empty square of a four: playing it makes five.
+FIVE_PATTERNS = gap_patterns(5, 4)
+# Empty squares of a three-stone window of five: playing one makes a four.
+FOUR_PATTERNS = gap_patterns(5, 3)
+# Middle gap of a three inside _????_: playing it makes an open four.
+OPEN_FOUR_PATTERNS = gap_patterns(6, 3, fixed_ends=True)
+# Middle gaps of a two inside _????_: playing one makes an open three.
+THREE_PATTERNS = gap_patterns(6, 2, fixed_ends=True)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class ThreatSearch:
+    # Threat-space search: the attacker only plays fours (VCF) or fours and
+    # open threes (VCT), and the defender only answers with the moves that
+    # stop them, so forced wins far beyond the alpha-beta horizon are
+    # proven or refuted within a node budget.
+    def __init__(self, state, budget=5000):
+        self.size = state.size
+        self.bits = BitBoard(state.size, state.values)
+        self.budget = budget
+        self.nodes = 0
+
+    def play(self, k, color):
+        self.bits.add(k, color)
+
+    def undo(self, k, color):
+        self.bits.remove(k, color)
+
+    def cells(self, patterns, color, all_gaps=False):
+        own = self.bits.stones[color]
+        empty = self.bits.empty()
+        bit_cells = self.bits.layout.bit_cells
+        found = set()
+        for pattern, gaps in patterns:
+            m = match(pattern, own, empty)
+            if not m:
+                continue
+            offsets = range(len(pattern)) if all_gaps else gaps
+            for offset in offsets:
+                if pattern[offset] != '_':
+                    continue
+                shifted = m << offset
+                while shifted:
+                    low = shifted & -shifted
+                    found.add(bit_cells[low.bit_length() - 1])
+                    shifted ^= low
+        return sorted(found)
+
+    def five_cells(self, color):
+        return self.cells(FIVE_PATTERNS, color)
+
+    def four_moves(self, color):
+        return self.cells(FOUR_PATTERNS, color)
+
+    def three_moves(self, color):
+        return self.cells(THREE_PATTERNS, color)
+
+    def three_defenses(self, color):
+        # Every empty square of a pattern that would let color make an open
+        # four; occupying any of them breaks that pattern.
+        return self.cells(OPEN_FOUR_PATTERNS, color, all_gaps=True)
+
+    def visit(self):
+        self.nodes += 1
+        if self.nodes > self.budget:
+            raise BudgetExceeded()
+
+    def vcf(self, attacker, depth):
+        self.visit()
+        defender = -attacker
+        wins = self.five_cells(attacker)
+        if wins:
+            return [wins[0]]
+        if depth == 0 or self.five_cells(defender):
+            return None
+
+        for m in self.four_moves(attacker):
+            self.play(m, attacker)
+            threats = self.five_cells(attacker)
+            line = None
+            if len(threats) >= 2:
+                line = [m, threats[0], threats[1]]
+            elif threats:
+                block = threats[0]
+                self.play(block, defender)
+                if not self.bits.has_five(defender):
+                    rest = self.vcf(attacker, depth - 1)
+                    if rest is not None:
+                        line = [m, block] + rest
+                self.undo(block, defender)
+            self.undo(m, attacker)
+            if line is not None:
+                return line
+        return None
+
+    def vct(self, attacker, depth):
+        self.visit()
+        defender = -attacker
+        wins = self.five_cells(attacker)
+        if wins:
+            return [wins[0]]
+        if depth == 0 or self.five_cells(defender):
+            return None
+
+        line = self.vcf(attacker, depth)
+        if line is not None:
+            return line
+
+        fours = self.four_moves(attacker)
+        threes = [m for m in self.three_moves(attacker) if m not in fours]
+        for m in fours + threes:
+            self.play(m, attacker)
+            threats = self.five_cells(attacker)
+            if threats:
+                replies = threats[:1] if len(threats) == 1 else []
+            else:
+                replies = sorted(set(self.three_defenses(attacker))
+                                 | set(self.four_moves(defender)))
+            proof = [m]
+            for reply in replies:
+                self.play(reply, defender)
+                rest = None
+                if not self.bits.has_five(defender):
+                    rest = self.vct(attacker, depth - 1)
+                self.undo(reply, defender)
+                if rest is None:
+                    proof = None
+                    break
+                if len(proof) == 1:
+                    proof += [reply] + rest
+            self.undo(m, attacker)
+            if proof is not None and (replies or threats):
+                return proof
+        return None
+
+
+def find_forced_win(state, color, budget=5000, vcf_depth=12, vct_depth=4):
+    # A winning threat sequence for color as (i, j) moves, or None when
+    # none is found within the budget.
+    search = ThreatSearch(state, budget)
+    try:
+        line = search.vcf(color, vcf_depth)
+        if line is None:
+            line = search.vct(color, vct_depth)
+    except BudgetExceeded:
+        line = None
+    if line is None:
+        return None
+    return [divmod(k, state.size) for k in line]
+
+
+def forced_blocks(state, color):
+    # Squares where the opponent of color would make five next move.
+    search = ThreatSearch(state)
+    return [divmod(k, state.size) for k in search.five_cells(-color)]
+
+
+def is_tactical(cells, size, k):
+    # Whether a stone on the empty cell k makes a four or an open three for
+    # either color: playing k creates one, or takes the square the opponent
+    # needs for one. cells is the board as a flat list.
+    for segment, p in cell_segments(size)[k]:
+        line = [cells[c] for c in segment]
+        n = len(line)
+        for color in (piece.BLACK, piece.WHITE):
+            # A window of five through k with 3 or 4 stones of color and
+            # none of the opponent's.
+            for s in range(max(0, p - 4), min(p, n - 5) + 1):
+                window = line[s:s + 5]
+                if window.count(color) >= 3 and -color not in window:
+                    return True
+            # _????_ with k in the middle, 2 stones of color and the rest
+            # empty (as in THREE_PATTERNS).
+            for s in range(max(0, p - 4), min(p - 1, n - 6) + 1):
+                if line[s] != piece.EMPTY or line[s + 5] != piece.EMPTY:
+                    continue
+                middle = line[s + 1:s + 5]
+                if middle.count(color) == 2 and -color not in middle:
+                    return True
+    return False
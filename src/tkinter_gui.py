@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import ttk
-from game import GameRunner
-import time
+import piece
+from service import EngineThread
 
 # Styling colors
 BACKGROUND_COLOR = "#547792"
@@ -17,6 +17,8 @@ SPINBOX_FG = "white"
 SPINBOX_BORDER = "#a0a0a0"
 FONT = ("Times New Roman", 12)
 FONTCOLOR = "white"
+# Milliseconds between status polls while the AI is thinking.
+PROGRESS_INTERVAL = 100
 
 class SetupWindow:
     def __init__(self):
@@ -96,7 +98,7 @@ class GomokuGUI:
         board_width = self.board_size  * self.cell_size
         board_height = self.board_size * self.cell_size 
         total_width = board_width + 6 * self.margin
-        total_height = board_height + 3 * self.margin + 60
+        total_height = board_height + 3 * self.margin + 90
         
         screen_width = self.root.winfo_screenwidth()
         screen_height = self.root.winfo_screenheight()
@@ -120,6 +122,13 @@ class GomokuGUI:
                                   fg=FONTCOLOR)
         self.time_label.pack(pady=(0, 10))
 
+        self.thinking_label = tk.Label(self.root,
+                                       text="",
+                                       bg=BACKGROUND_COLOR,
+                                       font=FONT,
+                                       fg=FONTCOLOR)
+        self.thinking_label.pack(pady=(0, 10))
+
         self.restart_button = tk.Button(self.root, text="New Game", command=self.restart_game,
                                         bg=BUTTON_BG, activebackground=BUTTON_HOVER_BG, fg=FONTCOLOR,
                                         relief=tk.FLAT, font=FONT)
@@ -128,22 +137,35 @@ class GomokuGUI:
         self.restart_button.bind("<Enter>", lambda e: self.restart_button.configure(bg=BUTTON_HOVER_BG))
         self.restart_button.bind("<Leave>", lambda e: self.restart_button.configure(bg=BUTTON_BG))
 
-        self.game = GameRunner(size=self.board_size, difficulty=self.difficulty)
-        self.game.restart(player_index=1)
+        # The engine runs in a background thread and searches in a worker
+        # process; the GUI only sends it requests and polls for the replies.
+        # It ponders the player's likely replies while they think.
+        self.engine = EngineThread(workers=1, time_budget=None)
+        response = self.engine.request({'op': 'new', 'size': self.board_size,
+                                        'difficulty': self.difficulty, 'player': 1,
+                                        'ponder': 3}).result()
+        self.status = response['status']
+        self.game_id = self.status['game']
+        self.stones = {}
+        self.drawn = piece.symbols[piece.EMPTY] * (self.board_size * self.board_size)
+        self.draw_grid()
         self.draw_board()
         self.canvas.bind('<Button-1>', self.handle_click)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+    def close(self):
+        self.engine.stop()
+        self.root.destroy()
     
     def restart_game(self):
-        self.root.destroy()
+        self.close()
         setup = SetupWindow()
         board_size, difficulty = setup.run()
         if board_size:
             gui = GomokuGUI(board_size, difficulty)
             gui.run()
     
-    def draw_board(self):
-        self.canvas.delete('all')
-
+    def draw_grid(self):
         for i in range(self.board_size):
             self.canvas.create_line(
                 self.margin, self.margin + i * self.cell_size,
@@ -156,40 +178,97 @@ class GomokuGUI:
                 self.margin + i * self.cell_size,
                 self.board_size * self.cell_size + self.margin,
                 fill=GRID_COLOR)
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                piece = self.game.state.values[i, j]
-                if piece != 0:
-                    x = self.margin + j * self.cell_size
-                    y = self.margin + i * self.cell_size
-                    color = BLACK_PIECE if piece == 1 else WHITE_PIECE
-                    self.canvas.create_oval(x - 12, y - 12, x + 12, y + 12,
-                                            fill=color, outline=GRID_COLOR)
+
+    def draw_board(self):
+        # Adds, recolors or removes only the stones whose cells changed
+        # since the last drawn status; self.stones maps cell -> oval item.
+        board = self.status['board']
+        if board == self.drawn:
+            return
+        empty = piece.symbols[piece.EMPTY]
+        for k, (old, cell) in enumerate(zip(self.drawn, board)):
+            if old == cell:
+                continue
+            if cell == empty:
+                self.canvas.delete(self.stones.pop(k))
+                continue
+            color = BLACK_PIECE if cell == piece.symbols[piece.BLACK] else WHITE_PIECE
+            if k in self.stones:
+                self.canvas.itemconfigure(self.stones[k], fill=color)
+            else:
+                i, j = divmod(k, self.board_size)
+                x = self.margin + j * self.cell_size
+                y = self.margin + i * self.cell_size
+                self.stones[k] = self.canvas.create_oval(x - 12, y - 12, x + 12, y + 12,
+                                                         fill=color, outline=GRID_COLOR)
+        self.drawn = board
+
+    def show_progress(self):
+        # Polls the engine's status while the AI thinks; the replies arrive
+        # through when_done, so the Tk loop never waits on the search.
+        if self.status['finished'] or not self.status['thinking']:
+            self.thinking_label.config(text="")
+            return
+        progress = self.status.get('progress')
+        text = "AI thinking..."
+        if progress and progress['depth']:
+            text += f" depth {progress['depth']}, {progress['nodes']} nodes"
+        self.thinking_label.config(text=text)
+        self.when_done(self.engine.request({'op': 'status', 'game': self.game_id}),
+                       self.progress_polled)
+
+    def progress_polled(self, response):
+        if not response['ok'] or not self.status['thinking']:
+            return
+        # The 'wait' reply may have landed first; don't draw over it.
+        if response['status']['thinking']:
+            self.status = response['status']
+        self.root.after(PROGRESS_INTERVAL, self.show_progress)
 
     def handle_click(self, event):
-        if self.game.finished:
+        if self.status['finished'] or self.status['thinking']:
             return
 
         board_x = round((event.x - self.margin) / self.cell_size)
         board_y = round((event.y - self.margin) / self.cell_size)
 
         if 0 <= board_x < self.board_size and 0 <= board_y < self.board_size:
-            if self.game.play(board_y, board_x):
-                self.draw_board()
-                self.root.update()
-                time.sleep(0.5)
-                move_time = self.game.aiplay()
-                self.time_label.config(text=f"AI Move Time: {move_time:.3f}s")
-                self.draw_board()
-
-                if self.game.finished:
-                    winner = "Black" if self.game.state.winner == 1 else "White"
-                    self.canvas.create_text(
-                        self.board_size * self.cell_size // 2 + self.margin,
-                        self.board_size * self.cell_size // 2 + self.margin,
-                        text=f"{winner} wins!",
-                        fill="red",
-                        font=("Helvetica", 16, "bold"))
+            request = {'op': 'play', 'game': self.game_id, 'i': board_y, 'j': board_x}
+            self.when_done(self.engine.request(request), self.played)
+
+    def when_done(self, future, callback):
+        # Polls an engine request from the Tk loop instead of blocking on it.
+        if future.done():
+            callback(future.result())
+        else:
+            self.root.after(20, self.when_done, future, callback)
+
+    def played(self, response):
+        if not response['ok']:
+            return
+        self.status = response['status']
+        self.draw_board()
+        self.when_done(self.engine.request({'op': 'wait', 'game': self.game_id}), self.ai_played)
+        self.show_progress()
+
+    def ai_played(self, response):
+        if not response['ok']:
+            return
+        self.status = response['status']
+        move_time = self.status['move_time']
+        depth = self.status['depth']
+        self.time_label.config(text=f"AI Move Time: {move_time:.3f}s (depth {depth})")
+        self.thinking_label.config(text="")
+        self.draw_board()
+
+        if self.status['finished']:
+            winner = "Black" if self.status['winner'] == 1 else "White"
+            self.canvas.create_text(
+                self.board_size * self.cell_size // 2 + self.margin,
+                self.board_size * self.cell_size // 2 + self.margin,
+                text=f"{winner} wins!",
+                fill="red",
+                font=("Helvetica", 16, "bold"))
 
     def run(self):
         self.root.mainloop()
@@ -0,0 +1,163 @@
+from collections import OrderedDict, namedtuple
+from zobrist import inverse_transform, transform
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+Entry = namedtuple('Entry', 'key depth value flag move generation')
+
+# Approximate memory per EvalCache entry (an OrderedDict item with an int
+# key and a float value), measured with tracemalloc.
+EVAL_ENTRY_BYTES = 165
+
+# The process's shared EvalCache (see worker_eval_cache).
+_worker_eval_cache = None
+
+
+class TranspositionTable:
+    # policy "depth": direct-mapped slots, an entry is replaced by a deeper
+    # search or by any search started after it was stored.
+    # policy "lru": up to max_entries positions, least recently used evicted.
+    # symmetric: probe/store key positions by their canonical hash, so the
+    # 8 symmetric variants of a position share one entry. The evaluation is
+    # not exactly symmetric (lines are scanned in one direction), so shared
+    # values are close to, not equal to, what a search of the variant gives.
+    def __init__(self, max_entries=1 << 18, policy="depth", symmetric=False):
+        if policy not in ("depth", "lru"):
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        self.max_entries = max_entries
+        self.policy = policy
+        self.symmetric = symmetric
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.clear()
+
+    def clear(self):
+        if self.policy == "lru":
+            self.entries = OrderedDict()
+        else:
+            self.entries = [None] * self.max_entries
+        # Filled slots, kept up to date by put() so len() need not scan them.
+        self.filled = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def get(self, key):
+        self.probes += 1
+        if self.policy == "lru":
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+        else:
+            entry = self.entries[key % self.max_entries]
+            if entry is None or entry.key != key:
+                return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, depth, value, flag, move):
+        entry = Entry(key, depth, value, flag, move, self.generation)
+        self.stores += 1
+        if self.policy == "lru":
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return
+
+        slot = key % self.max_entries
+        old = self.entries[slot]
+        if old is None:
+            self.filled += 1
+        elif not (old.key == key or depth >= old.depth or old.generation != self.generation):
+            return
+        self.entries[slot] = entry
+
+    def probe(self, board):
+        # get() for a board, with the stored move mapped into its frame.
+        if not self.symmetric:
+            return self.get(board.hash)
+        key, t = board.canonical_hash()
+        entry = self.get(key)
+        if entry is None or entry.move is None or t == 0:
+            return entry
+        return entry._replace(move=transform(board.size, entry.move, inverse_transform(t)))
+
+    def store(self, board, depth, value, flag, move):
+        if not self.symmetric:
+            return self.put(board.hash, depth, value, flag, move)
+        key, t = board.canonical_hash()
+        if move is not None:
+            move = transform(board.size, move, t)
+        self.put(key, depth, value, flag, move)
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def __len__(self):
+        if self.policy == "lru":
+            return len(self.entries)
+        return self.filled
+
+
+class EvalCache:
+    # Static evaluations keyed by position hash ^ zobrist.eval_keys, so by
+    # position, side to move and difficulty. Holds about max_bytes worth
+    # of entries, least recently used evicted. Easy's evaluation is random
+    # and must not be cached.
+    def __init__(self, max_bytes=1 << 24):
+        self.max_bytes = max_bytes
+        self.max_entries = max(1, max_bytes // EVAL_ENTRY_BYTES)
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def options_table(options):
+    # A new TranspositionTable with a search options dict's size, policy and
+    # symmetry; None when tt_size is 0.
+    if not options['tt_size']:
+        return None
+    return TranspositionTable(options['tt_size'], options['tt_policy'], options['tt_symmetry'])
+
+
+def worker_eval_cache(max_bytes):
+    # The EvalCache a (worker) process shares between all its searches,
+    # created with max_bytes on first use; None when max_bytes is 0. Leaf
+    # values do not depend on the game they were found in.
+    global _worker_eval_cache
+    if not max_bytes:
+        return None
+    if _worker_eval_cache is None:
+        _worker_eval_cache = EvalCache(max_bytes)
+    return _worker_eval_cache
@@ -0,0 +1,83 @@
+import random
+import piece
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(size):
+    # Seeded per board size so hashes are reproducible across processes.
+    rng = random.Random(size)
+    return {
+        piece.BLACK: tuple(rng.getrandbits(64) for _ in range(size * size)),
+        piece.WHITE: tuple(rng.getrandbits(64) for _ in range(size * size)),
+    }
+
+
+# The 8 rotations and reflections of the square board: transform t
+# transposes when t & 4 and then rotates a quarter turn t & 3 times.
+SYMMETRIES = 8
+
+
+def transform(size, position, t):
+    i, j = int(position[0]), int(position[1])
+    if t & 4:
+        i, j = j, i
+    for _ in range(t & 3):
+        i, j = j, size - 1 - i
+    return i, j
+
+
+@lru_cache(maxsize=None)
+def inverse_transform(t):
+    probe = (0, 1)
+    for u in range(SYMMETRIES):
+        if transform(5, transform(5, probe, t), u) == probe:
+            return u
+
+
+@lru_cache(maxsize=None)
+def symmetry_maps(size):
+    # symmetry_maps(size)[t][k] is the flat index cell k moves to under t.
+    return tuple(
+        tuple(i * size + j for i, j in
+              (transform(size, (k // size, k % size), t) for k in range(size * size)))
+        for t in range(SYMMETRIES))
+
+
+@lru_cache(maxsize=None)
+def symmetric_zobrist(size):
+    # symmetric_zobrist(size)[color][k][t] is the key of a stone on cell k
+    # in the board transformed by t, so that all 8 keys of a position can
+    # be updated together; t = 0 is the plain Zobrist key.
+    table = zobrist_table(size)
+    maps = symmetry_maps(size)
+    return {
+        color: tuple(tuple(table[color][maps[t][k]] for t in range(SYMMETRIES))
+                     for k in range(size * size))
+        for color in (piece.BLACK, piece.WHITE)
+    }
+
+
+def symmetric_keys(values):
+    # Zobrist key of the position under each of the 8 symmetries.
+    table = symmetric_zobrist(len(values))
+    keys = [0] * SYMMETRIES
+    for k, value in enumerate(values.flatten().tolist()):
+        if value != piece.EMPTY:
+            keys = [h ^ z for h, z in zip(keys, table[value][k])]
+    return keys
+
+
+def canonical(keys):
+    # The smallest of the symmetric keys and the transform t producing it;
+    # a move m of the position is transform(size, m, t) in canonical form.
+    t = min(range(SYMMETRIES), key=keys.__getitem__)
+    return keys[t], t
+
+
+@lru_cache(maxsize=None)
+def eval_keys(difficulty):
+    # Keys XORed into a position's hash to tell evaluations apart by side
+    # to move (current color) and difficulty, for EvalCache.
+    rng = random.Random(f"eval {difficulty}")
+    return {piece.BLACK: rng.getrandbits(64), piece.WHITE: rng.getrandbits(64)}
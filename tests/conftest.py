@@ -0,0 +1,25 @@
+import os
+import random
+import sys
+import pytest
+
+# The engine modules import each other by bare name from src/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from board import BoardState
+
+
+@pytest.fixture
+def random_game():
+    # random_game(size, seed, plies=None, backend="numpy") is every position
+    # of a seeded random game, each move played next to the stones already
+    # on the board (the first in the centre), until one side wins or, with
+    # plies, after that many moves.
+    def play(size, seed=0, plies=None, backend="numpy"):
+        rng = random.Random(seed)
+        states = [BoardState(size, backend=backend)]
+        while not states[-1].is_terminal() and (plies is None or len(states) <= plies):
+            state = states[-1]
+            states.append(state.next(rng.choice(state.legal_moves() or [(size // 2, size // 2)])))
+        return states
+    return play
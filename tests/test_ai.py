@@ -0,0 +1,34 @@
+import threading
+import piece
+from ai import SearchContext, get_best_move, static_move
+from benchmark import position_state
+from eval_fn import IncrementalEvaluator
+from threats import is_tactical
+
+
+def test_narrow_keeps_tactical_moves():
+    # Both colors have threes that the single statically best move cannot
+    # all cover.
+    state = position_state({'size': 15,
+                            'black': [(7, 5), (7, 6), (7, 7), (3, 3)],
+                            'white': [(10, 5), (10, 6), (10, 7), (12, 12)]})
+    board = state.search_board(IncrementalEvaluator(state))
+    ctx = SearchContext("Hard", max_color=piece.BLACK, widths=(1,))
+    moves = board.legal_moves()
+    narrowed = ctx.narrow(board, moves, 1, ())
+    tactical = [move for move in moves
+                if is_tactical(ctx.cells(board), board.size, move[0] * board.size + move[1])]
+    assert len(tactical) > 1
+    assert set(tactical) <= set(narrowed)
+
+
+def test_stopped_fixed_depth_search_returns_the_static_best_move():
+    state = position_state({'size': 15,
+                            'black': [(7, 7), (8, 8), (6, 9)],
+                            'white': [(7, 8), (6, 6), (9, 9)]})
+    stop = threading.Event()
+    stop.set()
+    info = {}
+    move, _, _ = get_best_move(state, 4, True, "Hard", info=info, threat_budget=0, stop=stop)
+    assert move == static_move(state, True, "Hard")
+    assert info['depth'] == 0
@@ -0,0 +1,63 @@
+import json
+import os
+import analysis
+from analysis import analyse, checkpoint_path, write_checkpoint
+from board import BoardState
+
+OPTIONS = {'depth': 1, 'time_budget': None, 'difficulty': "Hard", 'algorithm': "pvs",
+           'threat_budget': 0, 'tt_size': 0, 'tt_policy': "depth", 'tt_symmetry': False,
+           'lmr': False, 'widths': None, 'frontier': False, 'eval_cache_size': 0,
+           'timers': False}
+
+
+def test_malformed_records_are_reported(tmp_path):
+    records = [
+        '{"id": "good", "moves": [[7, 7], [7, 8], [8, 8]]}',
+        'not json',
+        '{"id": "short", "moves": [[7]]}',
+        '{"id": "no moves"}',
+        '{"id": "bad move", "moves": [7, 7]}',
+        '42',
+        '{"id": "illegal", "moves": [[7, 7], [7, 7]]}',
+        '[[7, 7], [8, 8]]',
+    ]
+    games = tmp_path / "games.jsonl"
+    games.write_text("\n".join(records) + "\n")
+    output = tmp_path / "out.jsonl"
+    written, positions = analyse(str(games), str(output), OPTIONS, workers=1)
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert written == len(records) == len(results)
+    assert positions == 3
+    assert [result['id'] for result in results] == \
+        ["good", 1, "short", "no moves", "bad move", 5, "illegal", 7]
+    assert [('error' in result) for result in results] == \
+        [False, True, True, True, True, True, True, False]
+
+
+def test_search_forwards_every_option(monkeypatch):
+    calls = []
+
+    def get_best_move(state, depth, is_max_state, difficulty, tt, time_budget, info, **kwargs):
+        calls.append((tt, kwargs))
+        info['depth'] = depth
+        return (7, 7), 0.0, 0.0
+
+    monkeypatch.setattr(analysis, 'get_best_move', get_best_move)
+    options = dict(OPTIONS, tt_size=64, tt_policy="lru", tt_symmetry=True, frontier=True,
+                   lmr=True, widths=[4, 2], threat_budget=50, algorithm="minimax")
+    analysis.search(BoardState(15), 2, True, options)
+    [(tt, kwargs)] = calls
+    assert (tt.max_entries, tt.policy, tt.symmetric) == (64, "lru", True)
+    assert kwargs['frontier'] and kwargs['lmr']
+    assert kwargs['widths'] == [4, 2]
+    assert (kwargs['threat_budget'], kwargs['algorithm']) == (50, "minimax")
+
+
+def test_fresh_run_drops_a_stale_checkpoint(tmp_path):
+    # The run writes no games, so it never saves a checkpoint of its own.
+    games = tmp_path / "games.jsonl"
+    games.write_text("")
+    output = str(tmp_path / "out.jsonl")
+    write_checkpoint(output, {'input_offset': 40, 'output_offset': 60, 'games': 1})
+    assert analyse(str(games), output, OPTIONS, workers=1) == (0, 0)
+    assert not os.path.exists(checkpoint_path(output))
@@ -0,0 +1,53 @@
+import json
+from benchmark import compare, main
+
+def report(nodes_per_sec=1000.0, p95=0.2, time=0.5, solved=True, position_bytes=1800,
+           peak_rss_kb=100000):
+    return {
+        'selfplay': [{'size': 15, 'difficulty': "Hard", 'nodes_per_sec': nodes_per_sec,
+                      'latency': {'p50': 0.1, 'p95': p95, 'p99': 0.3}}],
+        'tactical': [{'name': "open four", 'time': time, 'solved': solved}],
+        'positions': [{'size': 15, 'bytes': position_bytes}],
+        'peak_rss_kb': peak_rss_kb,
+        'peak_worker_rss_kb': 50000,
+    }
+
+
+BASELINE = report()
+
+
+def test_changes_within_the_threshold_pass():
+    assert compare(BASELINE, BASELINE, 0.2) == []
+    # Better on every metric, or worse by less than the threshold.
+    assert compare(BASELINE, report(2000.0, 0.1, 0.25, True, 1000, 50000), 0.2) == []
+    assert compare(BASELINE, report(900.0, 0.22, 0.55, True, 1900, 110000), 0.2) == []
+
+
+def test_regressions_fail_the_gate():
+    regressions = compare(BASELINE, report(700.0, 0.3, 1.0, False, 2400, 130000), 0.2)
+    assert [regression.split(':')[0] for regression in regressions] == [
+        "15x15 Hard nodes/s", "15x15 Hard p95 latency", "tactical open four time",
+        "tactical open four", "15x15 position bytes", "peak RSS"]
+
+
+def test_missing_metrics_are_skipped():
+    assert compare({}, report(1.0, 9.0, 9.0, False, 10 ** 6, 10 ** 9), 0.2) == []
+    assert compare(BASELINE, {}, 0.2) == []
+    # A baseline written before positions and worker RSS were measured.
+    old = {key: value for key, value in BASELINE.items()
+           if key not in ('positions', 'peak_worker_rss_kb')}
+    assert compare(old, report(position_bytes=10 ** 6), 0.2) == []
+    current = report()
+    del current['peak_rss_kb'], current['tactical']
+    assert compare(BASELINE, current, 0.2) == []
+
+
+def test_compare_command_exits_nonzero_on_regression(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(BASELINE))
+    current = tmp_path / "current.json"
+    current.write_text(json.dumps(report(p95=0.21)))
+    assert main(['compare', str(baseline), str(current)]) == 0
+    current.write_text(json.dumps(report(p95=0.5)))
+    assert main(['compare', str(baseline), str(current)]) == 1
+    assert main(['compare', str(baseline), str(current), '--threshold', '2']) == 0
@@ -0,0 +1,56 @@
+import pytest
+import piece
+from board import from_snapshot, is_five
+from eval_fn import evaluation_state
+from threats import is_tactical
+
+
+@pytest.fixture
+def random_games(random_game):
+    # (numpy state, bitboard state) after every move of count random games;
+    # both backends list candidates in the same order, so a seed plays the
+    # same game on each.
+    def play(size, count, seed=0):
+        for game in range(seed * count, (seed + 1) * count):
+            states = random_game(size, game)[1:]
+            bits = random_game(size, game, backend="bitboard")[1:]
+            assert [state.last_move for state in states] == [state.last_move for state in bits]
+            yield from zip(states, bits)
+    return play
+
+
+@pytest.mark.parametrize("size", [15, 19])
+def test_bitboard_wins_match_numpy(random_games, size):
+    wins = 0
+    for state, bits in random_games(size, 10):
+        assert bits.is_terminal() == state.is_terminal()
+        assert bits.winner == state.winner
+        i, j = state.last_move
+        assert bits.bits.five_through(i * size + j, state.color) == is_five(state.values, (i, j))
+        wins += state.winner != piece.EMPTY
+    assert wins > 0
+
+
+def test_bitboard_full_scan_matches_numpy(random_games):
+    for state, bits in random_games(15, 5, seed=1):
+        size, values, color, _, radius, _ = state.snapshot()
+        for backend in ("numpy", "bitboard"):
+            # No last move: the whole board is scanned.
+            scanned = from_snapshot((size, values, color, None, radius, backend))
+            assert scanned.check_five_in_a_row() == state.check_five_in_a_row()
+
+
+@pytest.mark.parametrize("difficulty", ["Medium", "Hard"])
+def test_bitboard_evaluation_matches_numpy(random_games, difficulty):
+    for state, bits in random_games(15, 3, seed=2):
+        for color in (piece.BLACK, piece.WHITE):
+            assert (evaluation_state(bits, color, difficulty)
+                    == evaluation_state(state, color, difficulty))
+
+
+def test_bitboard_tactical_matches_is_tactical(random_games):
+    for state, bits in random_games(15, 3, seed=3):
+        cells = state.values.ravel().tolist()
+        for i, j in state.legal_moves():
+            k = i * 15 + j
+            assert bits.bits.tactical(k) == is_tactical(cells, 15, k)
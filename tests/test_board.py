@@ -0,0 +1,97 @@
+import random
+import numpy as np
+import pytest
+import piece
+from benchmark import position_bytes, random_position
+from board import BoardState, neighbor_cells
+from eval_fn import IncrementalEvaluator
+from zobrist import SYMMETRIES, symmetric_keys, transform
+
+
+@pytest.mark.parametrize("backend", ["numpy", "bitboard"])
+def test_push_pop_restores_the_board(random_game, backend):
+    state = random_game(15, plies=12, backend=backend)[-1]
+    board = state.search_board(IncrementalEvaluator(state))
+    before = (board.values.copy(), list(board.hashes), board.legal_moves(), board.color,
+              board.last_move, board.evaluator.evaluate(piece.BLACK, "Hard"),
+              board.bits and dict(board.bits.stones))
+    rng = random.Random(1)
+    child = state
+    for _ in range(8):
+        move = rng.choice(board.legal_moves())
+        board.push(move)
+        child = child.next(move)
+    assert np.array_equal(board.values, child.values)
+    assert board.hashes == child.hashes == symmetric_keys(child.values)
+    assert board.legal_moves() == child.legal_moves()
+    for _ in range(8):
+        board.pop()
+    after = (board.values.copy(), list(board.hashes), board.legal_moves(), board.color,
+             board.last_move, board.evaluator.evaluate(piece.BLACK, "Hard"),
+             board.bits and dict(board.bits.stones))
+    assert np.array_equal(before[0], after[0])
+    assert before[1:] == after[1:]
+
+
+def test_symmetric_hashes_follow_the_board(random_game):
+    state = random_game(15, plies=10)[-1]
+    for t in range(SYMMETRIES):
+        values = np.zeros_like(state.values)
+        for i, j in zip(*np.nonzero(state.values)):
+            values[transform(15, (i, j), t)] = state.values[i, j]
+        assert symmetric_keys(values)[0] == state.hashes[t]
+        assert BoardState(15, values=values).canonical_hash()[0] == state.canonical_hash()[0]
+
+
+def star_candidates(values, radius):
+    # Brute force: empty cells with a stone within radius along one of the
+    # 8 line directions.
+    size = len(values)
+    moves = []
+    for i in range(size):
+        for j in range(size):
+            if values[i, j] == piece.EMPTY and any(
+                    0 <= i + di * step < size and 0 <= j + dj * step < size
+                    and values[i + di * step, j + dj * step] != piece.EMPTY
+                    for di in (-1, 0, 1) for dj in (-1, 0, 1) if di or dj
+                    for step in range(1, radius + 1)):
+                moves.append((i, j))
+    return moves
+
+
+def test_radius_two_candidates_form_a_star():
+    state = BoardState(15, radius=2).next((7, 7))
+    moves = state.legal_moves()
+    assert len(moves) == 16
+    assert (5, 5) in moves and (7, 9) in moves and (6, 8) in moves
+    assert (5, 6) not in moves and (6, 9) not in moves
+
+
+@pytest.mark.parametrize("radius", [1, 2])
+def test_candidates_follow_push_and_pop(radius):
+    rng = random.Random(radius)
+    state = BoardState(15, radius=radius).next((7, 7))
+    board = state.search_board(IncrementalEvaluator(state))
+    for _ in range(20):
+        board.push(rng.choice(board.legal_moves()))
+        assert sorted(board.legal_moves()) == star_candidates(board.values, radius)
+    for _ in range(20):
+        board.pop()
+        assert sorted(board.legal_moves()) == star_candidates(board.values, radius)
+
+
+# position_bytes of random_position(size, 30) before boards were stored as
+# int8 (int64 values, no candidate set).
+INT64_POSITION_BYTES = {15: 2575, 19: 3663}
+
+
+def test_stored_positions_are_compact():
+    for size, baseline in INT64_POSITION_BYTES.items():
+        state = random_position(size, 30)
+        # next() leaves the candidate set to be built on first use.
+        assert state._candidates is None
+        assert position_bytes(state) < 0.7 * baseline
+        cells = state.values.ravel()
+        assert state.legal_moves() == [divmod(k, size) for k in range(size * size)
+                                       if cells[k] == piece.EMPTY
+                                       and any(cells[n] != piece.EMPTY for n in neighbor_cells(size, 1)[k])]
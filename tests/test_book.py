@@ -0,0 +1,33 @@
+import numpy as np
+from board import BoardState
+from book import OpeningBook, book_path, load_book, write_book
+from zobrist import SYMMETRIES, transform
+
+
+def variant(state, t):
+    values = np.zeros_like(state.values)
+    for i, j in zip(*np.nonzero(state.values)):
+        values[transform(state.size, (i, j), t)] = state.values[i, j]
+    return BoardState(state.size, values=values, color=state.color)
+
+
+def test_written_book_answers_every_symmetric_variant(tmp_path, random_game):
+    size = 15
+    # From the third ply on, random positions have no symmetry of their own,
+    # so each stored move has a single image in every variant.
+    states = random_game(size, seed=4, plies=12)[3:]
+    entries = {}
+    for n, state in enumerate(states):
+        key, t = state.canonical_hash()
+        entries[key] = (transform(size, state.legal_moves()[n], t), float(n))
+    write_book(book_path(size, tmp_path), size, entries)
+
+    book = load_book(size, tmp_path)
+    assert isinstance(book, OpeningBook) and len(book) == len(states)
+    for n, state in enumerate(states):
+        move = state.legal_moves()[n]
+        for t in range(SYMMETRIES):
+            assert book.lookup(variant(state, t)) == (transform(size, move, t), float(n))
+    assert book.lookup(random_game(size, seed=5, plies=6)[-1]) is None
+    assert book.lookup(BoardState(size + 4)) is None
+    assert load_book(size + 4, tmp_path) is None
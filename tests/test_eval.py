@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import piece
+from eval_fn import IncrementalEvaluator, evaluate_boards, evaluate_children, evaluation_state
+
+DIFFICULTIES = ["Medium", "Hard"]
+
+
+@pytest.mark.parametrize("difficulty", DIFFICULTIES)
+@pytest.mark.parametrize("size", [15, 19])
+def test_incremental_evaluation_matches_evaluation_state(random_game, size, difficulty):
+    states = random_game(size, seed=size)
+    evaluator = IncrementalEvaluator(states[0])
+    for state in states[1:]:
+        evaluator.move(state.last_move, state.color)
+        for color in (piece.BLACK, piece.WHITE):
+            assert evaluator.evaluate(color, difficulty) == evaluation_state(state, color, difficulty)
+    for state in reversed(states[:-1]):
+        evaluator.undo()
+        assert evaluator.evaluate(-state.color, difficulty) == \
+            evaluation_state(state, -state.color, difficulty)
+
+
+@pytest.mark.parametrize("difficulty", DIFFICULTIES)
+def test_score_moves_matches_evaluation_state(random_game, difficulty):
+    for state in random_game(15, seed=1)[1:-1:5]:
+        evaluator = IncrementalEvaluator(state)
+        moves = state.legal_moves()
+        mover = -state.color
+        for current_color in (piece.BLACK, piece.WHITE):
+            scores = evaluator.score_moves(moves, mover, current_color, difficulty)
+            assert scores == pytest.approx(
+                [evaluation_state(state.next(move), current_color, difficulty) for move in moves])
+
+
+@pytest.mark.parametrize("difficulty", DIFFICULTIES)
+def test_evaluate_boards_matches_evaluation_state(random_game, difficulty):
+    states = random_game(15, seed=2)
+    colors = [-state.color for state in states]
+    values = evaluate_boards([state.values for state in states], colors, difficulty)
+    assert values.tolist() == pytest.approx(
+        [evaluation_state(state, color, difficulty) for state, color in zip(states, colors)])
+    assert evaluate_boards(np.stack([states[-1].values] * 3), piece.BLACK, difficulty).tolist() == \
+        pytest.approx([evaluation_state(states[-1], piece.BLACK, difficulty)] * 3)
+
+
+@pytest.mark.parametrize("difficulty", DIFFICULTIES)
+def test_evaluate_children_matches_evaluation_state(random_game, difficulty):
+    for state in random_game(15, seed=3)[1:-1:5]:
+        moves = state.legal_moves()
+        assert evaluate_children(state, moves, difficulty) == pytest.approx(
+            [evaluation_state(state.next(move), state.color, difficulty) for move in moves])
@@ -0,0 +1,16 @@
+import piece
+from benchmark import position_state
+from game import GameRunner
+
+
+def test_missing_move_falls_back_to_static_best():
+    runner = GameRunner(15, "Hard", tt_size=0, book=False)
+    runner.restart(player_index=piece.BLACK)
+    # White, the AI, is to move with an open four.
+    runner.state = position_state({'size': 15,
+                                   'black': [(3, 3), (10, 10), (11, 4), (2, 12), (12, 12)],
+                                   'white': [(7, 3), (7, 4), (7, 5), (7, 6)]})
+    runner.ai_move(None, 1.0)
+    assert runner.finished
+    assert runner.state.color == piece.WHITE
+    assert piece.WHITE in (runner.state.values[7, 2], runner.state.values[7, 7])
@@ -0,0 +1,53 @@
+import pytest
+import piece
+from ai import get_best_move
+from benchmark import position_state
+from parallel import RootSearchPool
+from transposition import TranspositionTable
+
+POSITIONS = {
+    # White has an open four and black is to move: every move loses.
+    'lost': {'size': 15,
+             'black': [(3, 3), (10, 10), (11, 4), (2, 12)],
+             'white': [(7, 3), (7, 4), (7, 5), (7, 6)]},
+    # Black has an open four and is to move.
+    'won': {'size': 15,
+            'black': [(7, 3), (7, 4), (7, 5), (7, 6), (12, 12)],
+            'white': [(3, 3), (10, 10), (11, 4), (2, 12)]},
+    'quiet': {'size': 15,
+              'black': [(7, 7), (8, 8), (6, 9)],
+              'white': [(7, 8), (6, 6), (9, 9)]},
+}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = RootSearchPool(2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("algorithm", ["pvs", "minimax"])
+@pytest.mark.parametrize("depth", [2, 3])
+@pytest.mark.parametrize("name", sorted(POSITIONS))
+def test_pool_matches_sequential(pool, name, depth, algorithm):
+    state = position_state(POSITIONS[name])
+    is_max_state = -state.color == piece.BLACK
+    results = []
+    for search_pool in (None, pool):
+        move, value, _ = get_best_move(state, depth, is_max_state, "Hard", TranspositionTable(),
+                                       pool=search_pool, algorithm=algorithm)
+        results.append((tuple(map(int, move)), value))
+    assert results[0] == results[1]
+
+
+def test_pool_reports_workers_stats(pool):
+    state = position_state(POSITIONS['quiet'])
+    info = {}
+    get_best_move(state, 3, True, "Hard", TranspositionTable(), info=info, pool=pool, lmr=True)
+    stats = info['stats']
+    assert stats['nodes'] == info['nodes'] > len(POSITIONS['quiet']['black'])
+    assert stats['leaves'] > 0 and stats['interior'] > 0
+    assert sum(stats['cutoffs_by_ply'].values()) == stats['cutoffs'] > 0
+    # The workers probe their own tables.
+    assert stats['tt_probes'] > 0
@@ -0,0 +1,20 @@
+import time
+from service import EngineThread
+
+
+def test_stop_during_a_long_search_returns_quickly():
+    engine = EngineThread(workers=1, time_budget=30.0)
+    try:
+        game = engine.request({'op': 'new', 'size': 15, 'difficulty': "Hard"}).result()
+        game_id = game['status']['game']
+        # The reply to the first stone comes from the opening rules; the
+        # second move starts a real search.
+        engine.request({'op': 'play', 'game': game_id, 'i': 7, 'j': 7}).result()
+        engine.request({'op': 'wait', 'game': game_id}).result()
+        status = engine.request({'op': 'play', 'game': game_id, 'i': 9, 'j': 9}).result()
+        assert status['status']['thinking']
+        time.sleep(0.5)
+    finally:
+        started = time.time()
+        engine.stop()
+    assert time.time() - started < 2.0
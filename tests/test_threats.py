@@ -0,0 +1,74 @@
+import piece
+from benchmark import position_state
+from threats import find_forced_win, forced_blocks
+
+# Black to move has two closed threes crossing at (7, 7): playing there
+# makes a double four.
+DOUBLE_FOUR = {'size': 15,
+               'black': [(7, 4), (7, 5), (7, 6), (4, 7), (5, 7), (6, 7)],
+               'white': [(7, 3), (3, 7), (12, 12), (12, 1), (1, 12), (1, 1)]}
+# As above with (4, 7) missing: black first plays it as a four on row 4,
+# which white must block, and then the crossing wins.
+TWO_STEP_VCF = {'size': 15,
+                'black': [(7, 4), (7, 5), (7, 6), (5, 7), (6, 7), (4, 4), (4, 5), (4, 6)],
+                'white': [(7, 3), (3, 7), (4, 3), (12, 12), (12, 1), (1, 12), (1, 1), (14, 14)]}
+QUIET = {'size': 15,
+         'black': [(7, 7), (8, 8), (6, 9)],
+         'white': [(7, 8), (6, 6), (9, 9)]}
+
+
+def play_line(state, line, attacker):
+    # Plays a threat line, checking that every defender move was forced.
+    for n, move in enumerate(line):
+        if n % 2 == 1:
+            assert move in forced_blocks(state, -attacker)
+        assert state.is_valid_position(move)
+        state = state.next(move)
+    return state
+
+
+def test_finds_a_double_four():
+    state = position_state(DOUBLE_FOUR)
+    line = find_forced_win(state, piece.BLACK, budget=1000)
+    assert line is not None and line[0] == (7, 7)
+    final = play_line(state, line, piece.BLACK)
+    assert final.is_terminal() and final.winner == piece.BLACK
+
+
+def test_finds_a_vcf_through_a_forced_reply():
+    state = position_state(TWO_STEP_VCF)
+    assert find_forced_win(state, piece.BLACK, budget=5000, vcf_depth=1, vct_depth=0) is None
+    line = find_forced_win(state, piece.BLACK, budget=5000)
+    assert line is not None and len(line) >= 5
+    final = play_line(state, line, piece.BLACK)
+    assert final.is_terminal() and final.winner == piece.BLACK
+
+
+def test_no_forced_win():
+    assert find_forced_win(position_state(QUIET), piece.BLACK, budget=5000) is None
+
+
+def test_budget_exhaustion_returns_none():
+    state = position_state(TWO_STEP_VCF)
+    # The line needs a node per attacking move; one is not enough.
+    assert find_forced_win(state, piece.BLACK, budget=1) is None
+
+
+def test_forced_blocks_keep_every_defence():
+    others = [(7, 7), (8, 8), (3, 3)]
+    positions = [
+        # A closed four (one five square) and an open four (two).
+        ({'black': others + [(5, 3)], 'white': [(5, 4), (5, 5), (5, 6), (5, 7)]}, 1),
+        ({'black': others + [(9, 6)], 'white': [(5, 4), (5, 5), (5, 6), (5, 7)]}, 2),
+        # An open three threatens no five yet: the root is not narrowed.
+        ({'black': others, 'white': [(8, 4), (8, 5), (8, 6)]}, 0),
+    ]
+    for position, count in positions:
+        state = position_state(dict(position, size=15))
+        blocks = forced_blocks(state, piece.BLACK)
+        assert len(blocks) == count
+        if blocks:
+            # Any other move lets white make five at once.
+            for move in state.legal_moves():
+                if move not in blocks:
+                    assert forced_blocks(state.next(move), piece.BLACK)
@@ -0,0 +1,91 @@
+import numpy as np
+from ai import SearchContext, get_top_moves
+from board import BoardState
+from eval_fn import IncrementalEvaluator
+from transposition import EVAL_ENTRY_BYTES, EXACT, EvalCache, TranspositionTable, worker_eval_cache
+from zobrist import SYMMETRIES, transform
+
+STONES = {(7, 7): 1, (7, 8): -1, (8, 9): 1, (5, 6): -1, (9, 3): 1}
+
+
+def variant(size, t):
+    values = np.zeros((size, size), dtype=np.int8)
+    for position, color in STONES.items():
+        values[transform(size, position, t)] = color
+    return BoardState(size, values=values)
+
+
+def test_symmetric_table_maps_moves_between_variants():
+    size = 15
+    move = (6, 10)
+    for stored in range(SYMMETRIES):
+        tt = TranspositionTable(1 << 10, symmetric=True)
+        tt.store(variant(size, stored), 3, 42.0, 0, transform(size, move, stored))
+        for probed in range(SYMMETRIES):
+            entry = tt.probe(variant(size, probed))
+            assert entry is not None and entry.value == 42.0
+            assert entry.move == transform(size, move, probed)
+
+
+def test_plain_table_keeps_variants_apart():
+    tt = TranspositionTable(1 << 10)
+    tt.store(variant(15, 0), 3, 42.0, 0, (6, 10))
+    assert tt.probe(variant(15, 0)).move == (6, 10)
+    assert all(tt.probe(variant(15, t)) is None for t in range(1, SYMMETRIES))
+
+
+def test_eval_cache_evicts_least_recently_used():
+    cache = EvalCache(3 * EVAL_ENTRY_BYTES)
+    for key in (1, 2, 3):
+        cache.put(key, float(key))
+    assert cache.get(1) == 1.0
+    cache.put(4, 4.0)
+    assert len(cache) == 3
+    assert cache.get(2) is None
+    assert [cache.get(key) for key in (1, 3, 4)] == [1.0, 3.0, 4.0]
+    assert (cache.hits, cache.misses) == (4, 1)
+    assert cache.hit_rate() == 0.8
+
+
+def test_easy_skips_the_eval_cache():
+    state = BoardState(15).next((7, 7)).next((7, 8))
+    cache = EvalCache()
+    assert SearchContext("Easy", eval_cache=cache).eval_cache is None
+    board = state.search_board(IncrementalEvaluator(state))
+    get_top_moves(board, 3, True, "Easy", eval_cache=cache)
+    assert len(cache) == 0
+    get_top_moves(board, 3, True, "Hard", eval_cache=cache)
+    assert len(cache) == len(board.legal_moves())
+
+
+def test_worker_eval_cache_is_shared():
+    assert worker_eval_cache(0) is None
+    cache = worker_eval_cache(1 << 16)
+    assert worker_eval_cache(1 << 16) is cache
+
+
+def test_depth_policy_keeps_the_deeper_entry_of_a_slot():
+    tt = TranspositionTable(4)
+    tt.put(1, 3, 1.0, EXACT, None)
+    # Key 5 maps to key 1's slot; a shallower search of the same generation
+    # does not evict it, a deeper one or a later search does.
+    tt.put(5, 2, 5.0, EXACT, None)
+    assert tt.get(1).value == 1.0 and tt.get(5) is None
+    tt.put(5, 4, 5.0, EXACT, None)
+    assert tt.get(1) is None and tt.get(5).value == 5.0
+    tt.new_search()
+    tt.put(1, 1, 1.0, EXACT, None)
+    assert tt.get(1).value == 1.0 and tt.get(5) is None
+    tt.put(2, 1, 2.0, EXACT, None)
+    assert len(tt) == 2
+
+
+def test_lru_policy_evicts_the_least_recently_used_entry():
+    tt = TranspositionTable(2, policy="lru")
+    tt.put(1, 3, 1.0, EXACT, None)
+    tt.put(2, 1, 2.0, EXACT, None)
+    assert tt.get(1).value == 1.0
+    tt.put(3, 1, 3.0, EXACT, None)
+    assert tt.get(2) is None
+    assert tt.get(1).value == 1.0 and tt.get(3).value == 3.0
+    assert len(tt) == 2